@@ -1,5 +1,5 @@
 // SPDX-License-Identifier: MIT
-pragma solidity ^0.8.0;
+pragma solidity ^0.8.5;
 
 contract PaymentContract {
     address public owner;
@@ -8,11 +8,37 @@ contract PaymentContract {
     /// Mapping: buyer address => contentId => hasPaid
     mapping(address => mapping(bytes32 => bool)) public paidContent;
 
+    /// Prepaid credit: buyer address => deposited wei not yet spent
+    mapping(address => uint256) public deposits;
+    uint256 public totalDeposits;
+    /// Buyer address => time after which the deposit can be withdrawn (0 = no withdrawal requested)
+    mapping(address => uint256) public withdrawAfter;
+    uint256 public constant WITHDRAW_DELAY = 1 days;
+
+    /// EIP-712 voucher a buyer signs off-chain to spend `amount` of its deposit on `contentId`
+    struct Voucher {
+        address payer;
+        bytes32 contentId;
+        uint256 amount;
+    }
+    bytes32 public constant VOUCHER_TYPEHASH = keccak256("Voucher(address payer,bytes32 contentId,uint256 amount)");
+    bytes32 public immutable DOMAIN_SEPARATOR;
+
     event PaymentReceived(address indexed user, bytes32 indexed contentId, uint256 amount);
+    event Deposited(address indexed user, uint256 amount);
+    event WithdrawalRequested(address indexed user, uint256 availableAt);
+    event Withdrawn(address indexed user, uint256 amount);
 
     constructor(uint256 _price) {
         owner = msg.sender;
         price = _price;
+        DOMAIN_SEPARATOR = keccak256(abi.encode(
+            keccak256("EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"),
+            keccak256("PaymentContract"),
+            keccak256("1"),
+            block.chainid,
+            address(this)
+        ));
     }
 
     modifier onlyOwner() {
@@ -29,6 +55,66 @@ contract PaymentContract {
         emit PaymentReceived(msg.sender, contentId, msg.value);
     }
 
+    /// @notice Buyer tops up its prepaid balance; cancels a pending withdrawal request
+    function deposit() external payable {
+        deposits[msg.sender] += msg.value;
+        totalDeposits += msg.value;
+        withdrawAfter[msg.sender] = 0;
+        emit Deposited(msg.sender, msg.value);
+    }
+
+    /// @notice Buyer announces a withdrawal; the delay leaves time to settle vouchers it already signed
+    function requestWithdrawal() external {
+        require(deposits[msg.sender] > 0, "Nothing to withdraw");
+        withdrawAfter[msg.sender] = block.timestamp + WITHDRAW_DELAY;
+        emit WithdrawalRequested(msg.sender, withdrawAfter[msg.sender]);
+    }
+
+    /// @notice Buyer withdraws its remaining deposit once the withdrawal delay has passed
+    function withdrawDeposit() external {
+        uint256 available = withdrawAfter[msg.sender];
+        require(available != 0 && block.timestamp >= available, "Withdrawal not available yet");
+        uint256 amount = deposits[msg.sender];
+        deposits[msg.sender] = 0;
+        totalDeposits -= amount;
+        withdrawAfter[msg.sender] = 0;
+        payable(msg.sender).transfer(amount);
+        emit Withdrawn(msg.sender, amount);
+    }
+
+    /// @notice Owner redeems a batch of signed vouchers against the buyers' deposits
+    /// @dev Invalid, already paid or uncovered vouchers are skipped so one bad voucher can't block the batch
+    function settleVouchers(Voucher[] calldata vouchers, bytes[] calldata signatures) external onlyOwner returns (uint256 settled) {
+        require(vouchers.length == signatures.length, "Length mismatch");
+        for (uint256 i = 0; i < vouchers.length; i++) {
+            Voucher calldata v = vouchers[i];
+            if (v.amount < price || paidContent[v.payer][v.contentId] || deposits[v.payer] < v.amount) continue;
+            if (_voucherSigner(v, signatures[i]) != v.payer) continue;
+
+            deposits[v.payer] -= v.amount;
+            totalDeposits -= v.amount;
+            paidContent[v.payer][v.contentId] = true;
+            emit PaymentReceived(v.payer, v.contentId, v.amount);
+            settled += v.amount;
+        }
+        payable(owner).transfer(settled);
+    }
+
+    function _voucherSigner(Voucher calldata v, bytes calldata signature) internal view returns (address) {
+        if (signature.length != 65) return address(0);
+        bytes32 digest = keccak256(abi.encodePacked(
+            "\x19\x01",
+            DOMAIN_SEPARATOR,
+            keccak256(abi.encode(VOUCHER_TYPEHASH, v.payer, v.contentId, v.amount))
+        ));
+        bytes32 r = bytes32(signature[0:32]);
+        bytes32 s = bytes32(signature[32:64]);
+        uint8 v8 = uint8(signature[64]);
+        // Reject malleable signatures (upper-half s)
+        if (uint256(s) > 0x7FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF5D576E7357A4501DDFE92F46681B20A0) return address(0);
+        return ecrecover(digest, v8, r, s);
+    }
+
     /// @notice Verify whether a user has paid for a specific content
     function hasPaid(address user, bytes32 contentId) external view returns (bool) {
         return paidContent[user][contentId];
@@ -39,9 +125,9 @@ contract PaymentContract {
         price = _price;
     }
 
-    /// @notice Withdraw contract balance to owner
+    /// @notice Withdraw contract balance to owner, except buyers' unspent deposits
     function withdraw() public onlyOwner {
-        payable(owner).transfer(address(this).balance);
+        payable(owner).transfer(address(this).balance - totalDeposits);
     }
 
     /// @notice Reject accidental ETH transfers
@@ -0,0 +1,86 @@
+import asyncio, json, logging, threading
+
+from eth_utils import to_hex
+from hexbytes import HexBytes
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from web3 import EthereumTesterProvider, Web3
+from web3.providers.eth_tester.middleware import request_formatters, result_formatters
+
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── local chain ──────────────────
+class LocalChain:
+    """
+    In-process eth-tester chain served over JSON-RPC
+
+    The agents only know how to reach a chain at RPC_URL, so requests are
+    translated between the JSON-RPC wire format and what eth-tester expects,
+    with the same formatters web3 uses for its own EthereumTesterProvider.
+    Every transaction is mined into a block of its own as soon as it arrives.
+    """
+
+    def __init__(self):
+        self.provider = EthereumTesterProvider()
+        self.w3 = Web3(self.provider)
+        self.keys = [key.to_hex() for key in self.provider.ethereum_tester.backend.account_keys]
+        self.requests = 0
+        self._lock = threading.Lock()  # py-evm is not thread-safe
+
+    def deploy(self, abi: list, bytecode: str, *args, key_index: int = 0) -> str:
+        """Deploys a contract from the `key_index`-th funded account and returns its address"""
+        owner = self.w3.eth.accounts[key_index]
+        with self._lock:
+            txh = self.w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args).transact({"from": owner})
+            return self.w3.eth.wait_for_transaction_receipt(txh)["contractAddress"]
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/", self._handle, methods=["POST"])])
+
+    # Helper functions
+    async def _handle(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        if isinstance(body, list):
+            return JSONResponse([await asyncio.to_thread(self._call, item) for item in body])
+        return JSONResponse(await asyncio.to_thread(self._call, body))
+
+    def _call(self, request: dict) -> dict:
+        method, params = request["method"], request.get("params", [])
+        if method in request_formatters:
+            params = request_formatters[method](params)
+        with self._lock:
+            response = self.provider.make_request(method, params)
+        self.requests += 1
+        response["id"] = request.get("id")
+        if "result" in response:
+            result = response["result"]
+            if method in result_formatters:
+                result = result_formatters[method](result)
+            response["result"] = _to_wire(result)
+        elif "error" in response and not isinstance(response["error"], dict):
+            response["error"] = {"code": -32000, "message": str(response["error"])}
+        return response
+
+
+def _to_wire(value):
+    """Encodes quantities and byte strings the way a JSON-RPC node would"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray, HexBytes)):
+        return to_hex(value)
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(item) for item in value]
+    return value
+
+
+def load_abi(path: str = "billing_agent/contract_abi.json") -> list:
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,61 @@
+import asyncio, os, random, runpy, sys
+from typing import AsyncGenerator
+
+from google.adk.models import BaseLlm, LLMRegistry
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+
+LATENCY = float(os.getenv("BENCH_LLM_LATENCY", 2.0))  # seconds per model call
+JITTER = float(os.getenv("BENCH_LLM_JITTER", 0.2))    # +/- fraction of LATENCY
+
+
+# ────────────────── fake gemini ──────────────────
+class FakeGemini(BaseLlm):
+    """
+    Stand-in for Gemini that answers after a configurable delay, without any API call
+
+    Like the real model it first calls `search_papers` with the user's query,
+    then writes a Markdown report over the papers it got back.
+    """
+
+    model: str = "fake-gemini"
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"fake-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False,
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(LATENCY * random.uniform(1 - JITTER, 1 + JITTER))
+        last = llm_request.contents[-1]
+        results = [part.function_response.response for part in last.parts if part.function_response]
+        if results:
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=_report(results[0]))]))
+            return
+        query = " ".join(part.text for part in last.parts if part.text)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+            name="search_papers",
+            args={"queries": [query], "max_results": 10, "categories": [], "since": ""},
+        ))]))
+
+
+def _report(result: dict) -> str:
+    papers = result.get("result") or []
+    lines = ["## Recent Papers"]
+    for i, paper in enumerate(papers, 1):
+        lines.append(f"{i}. **{paper['title']}** ({', '.join(paper['authors'])}, {paper['published']})")
+        lines.append(f"   *Summary:* {paper['summary'][:200]}")
+    lines += ["", "## Recent Trend Analysis", f"- {len(papers)} papers matched the query."]
+    return "\n".join(lines)
+
+
+# Runs the research agent with FakeGemini in place of Gemini;
+# takes the same options as research_agent/__main__.py
+if __name__ == '__main__':
+    LLMRegistry.register(FakeGemini)
+    os.environ.setdefault("RESEARCH_MODEL", "fake-gemini")
+    sys.path.insert(0, "research_agent")
+    runpy.run_path("research_agent/__main__.py", run_name="__main__")
@@ -0,0 +1,357 @@
+import asyncio, click, hashlib, json, logging, os, random, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from uuid import uuid4
+
+import httpx, uvicorn
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from a2a.types import Message, Part, TaskState, TaskStatusUpdateEvent, TextPart
+from a2a.utils import get_message_text
+
+from common.remote import RemoteAgentPool
+
+from chain import LocalChain, load_abi
+
+
+PRICE_WEI = 10**18
+PHASES = ("invoice", "payment", "confirmation", "verification", "research")
+# Status messages relayed to the client that mark the start of each phase
+MARKERS = {
+    "Paying contract...": "payment",
+    "Signing voucher...": "payment",
+    "Waiting for confirmation...": "confirmation",
+    "Sending contentId...": "verification",
+    "Payment confirmed. Fetching content...": "research",
+}
+TOPICS = [
+    "large language model agents", "retrieval augmented generation", "diffusion models for video",
+    "graph neural networks", "reinforcement learning from human feedback", "speculative decoding",
+    "mixture of experts", "vision language models", "federated learning privacy", "code generation benchmarks",
+]
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── load driver ──────────────────
+async def drive(user_url: str, billing_url: str, queries: list[str], concurrency: int) -> list[dict]:
+    """Sends every query to the UserAgent, `concurrency` at a time, and times each phase from its status updates"""
+    pool = RemoteAgentPool(timeout=300, max_connections=concurrency)
+    agent = pool.get(user_url)
+    pending = iter(queries)
+    results = []
+
+    async def one(query: str) -> dict:
+        started = time.monotonic()
+        marks = {"invoice": 0.0}
+        def on_update(event):
+            if isinstance(event, TaskStatusUpdateEvent) and event.status.message:
+                phase = MARKERS.get(get_message_text(event.status.message))
+                if phase:
+                    marks.setdefault(phase, time.monotonic() - started)
+        try:
+            task = await agent.send(
+                Message(role="user", messageId=str(uuid4()), parts=[Part(TextPart(text=query)), Part(TextPart(text=billing_url))]),
+                on_update,
+            )
+            ok, error = task.status.state == TaskState.completed, None
+            if not ok:
+                error = get_message_text(task.status.message) if task.status.message else task.status.state.value
+        except Exception as e:
+            ok, error = False, str(e)
+        total = time.monotonic() - started
+        ordered = sorted(marks.items(), key=lambda item: item[1])
+        durations = {phase: end - start for (phase, start), (_, end) in zip(ordered, [*ordered[1:], (None, total)])}
+        return {"ok": ok, "error": error, "total": total, "phases": durations}
+
+    async def worker():
+        for query in pending:
+            results.append(await one(query))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await pool.aclose()
+    return results
+
+
+def summarize(results: list[dict], wall: float) -> dict:
+    done = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "requests": len(results),
+        "completed": len(done),
+        "failed": len(results) - len(done),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput": round(len(done) / wall, 4) if wall else 0.0,
+        "latency": {
+            phase: _distribution([r["phases"][phase] for r in done if phase in r["phases"]])
+            for phase in PHASES
+        } | {"total": _distribution([r["total"] for r in done])},
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lists phases whose p95 latency grew by more than `tolerance`, and a throughput drop beyond it"""
+    regressions = []
+    for phase, stats in result["latency"].items():
+        before = baseline.get("latency", {}).get(phase, {}).get("p95")
+        if before and stats["p95"] is not None and stats["p95"] > before * (1 + tolerance):
+            regressions.append(f"{phase} p95 {before:.3f}s -> {stats['p95']:.3f}s")
+    before = baseline.get("throughput")
+    if before and result["throughput"] < before * (1 - tolerance):
+        regressions.append(f"throughput {before:.3f}/s -> {result['throughput']:.3f}/s")
+    return regressions
+
+
+# Helper functions
+def _distribution(values: list[float]) -> dict:
+    values = sorted(values)
+    def percentile(q: float) -> float | None:
+        if not values:
+            return None
+        rank = q * (len(values) - 1)
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        return round(values[low] + (values[high] - values[low]) * (rank - low), 4)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else None,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": round(values[-1], 4) if values else None,
+    }
+
+
+def _contract_bytecode(bin_path: str | None, solc_version: str) -> str:
+    if bin_path:
+        with open(bin_path, "r") as f:
+            return f.read().strip()
+    try:
+        import solcx
+        if solc_version not in {str(version) for version in solcx.get_installed_solc_versions()}:
+            logger.info(f"Installing solc {solc_version}")
+            solcx.install_solc(solc_version)
+        compiled = solcx.compile_files(
+            [os.path.join(ROOT, "BillingContract.sol")], output_values=["bin"], solc_version=solc_version,
+        )
+    except Exception as e:
+        # The precompiled contract will do, as long as it was built from the current source
+        bytecode = _artifact_bytecode()
+        if bytecode:
+            logger.warning(f"Could not compile BillingContract.sol ({e}), using BillingContract.json")
+            return bytecode
+        raise click.ClickException(
+            f"Could not compile BillingContract.sol with solc {solc_version} ({e}). "
+            f"Install the bench requirements with `pip install -r requirements-dev.txt`, or pass --contract-bin"
+        )
+    return next(output["bin"] for name, output in compiled.items() if name.endswith(":PaymentContract"))
+
+
+def _artifact_bytecode() -> str | None:
+    try:
+        with open(os.path.join(ROOT, "BillingContract.json"), "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return None
+    with open(os.path.join(ROOT, "BillingContract.sol"), "rb") as f:
+        fresh = artifact["source_sha256"] == hashlib.sha256(f.read()).hexdigest()
+    return artifact["bin"] if fresh else None
+
+
+def _write_arxiv_dump(path: str, papers: int):
+    """Synthetic arXiv metadata dump for the research agent's local index"""
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(papers):
+            topic = TOPICS[i % len(TOPICS)]
+            created = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() + rng.randrange(300 * 86400)
+            record = {
+                "id": f"2501.{i:05d}",
+                "title": f"On {topic}: study {i}",
+                "abstract": f"We study {topic} and propose method {i}, improving over prior work on {rng.choice(TOPICS)}.",
+                "authors": "Ada Lovelace, Alan Turing",
+                "categories": "cs.CL cs.LG",
+                "versions": [{"version": "v1", "created": format_datetime(datetime.fromtimestamp(created, timezone.utc))}],
+                "update_date": "2025-11-01",
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+def _start(name: str, args: list[str], env: dict, log_dir: str) -> subprocess.Popen:
+    log = open(os.path.join(log_dir, f"{name}.log"), "w")
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(name: str, url: str, process: subprocess.Popen, log_dir: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                if (await client.get(f"{url}/.well-known/agent.json")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    with open(os.path.join(log_dir, f"{name}.log"), "r") as f:
+        tail = "".join(f.readlines()[-20:])
+    raise click.ClickException(f"{name} agent did not start:\n{tail}")
+
+
+# ────────────────── benchmark CLI ──────────────────
+@click.command()
+@click.option('--requests', 'requests', default=50)          # queries sent in total
+@click.option('--concurrency', default=10)                   # queries in flight at once
+@click.option('--distinct', default=0)                       # distinct queries among them, 0 = all different
+@click.option('--llm-latency', 'llm_latency', default=2.0)   # seconds per fake Gemini call, two calls per query
+@click.option('--llm-jitter', 'llm_jitter', default=0.2)     # +/- fraction of the latency
+@click.option('--papers', default=2000)                      # papers in the fake arXiv index
+@click.option('--wallets', default=4)                        # user wallets paying in parallel (at most 9)
+@click.option('--payment-mode', 'payment_mode', type=click.Choice(["onchain", "voucher"]), default="onchain")
+@click.option('--research-concurrency', 'research_concurrency', default=4)  # research agent's --concurrency
+@click.option('--base-port', 'base_port', default=10100)     # chain, user, billing and research agents use the next 4 ports
+@click.option('--contract-bin', 'contract_bin', default=None)  # hex bytecode of BillingContract.sol, instead of compiling
+@click.option('--solc-version', 'solc_version', default='0.8.20')
+@click.option('--output', default=None)                      # defaults to .cache/bench/<timestamp>.json
+@click.option('--baseline', default=None)                    # earlier result file to compare against
+@click.option('--tolerance', default=0.1)                    # allowed p95 / throughput regression vs the baseline
+@click.option('--trace-dir', 'trace_dir', default=None)      # have the agents write their spans here
+def main(
+    requests, concurrency, distinct, llm_latency, llm_jitter, papers, wallets, payment_mode,
+    research_concurrency, base_port, contract_bin, solc_version, output, baseline, tolerance, trace_dir,
+):
+    """Runs all three agents against a local chain, a fake Gemini and a fake arXiv index, and measures them under load"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for noisy in ("httpx", "a2a"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    if not 1 <= wallets <= 9:
+        raise click.BadParameter("must be between 1 and 9", param_hint="--wallets")
+    config = {
+        "requests": requests, "concurrency": concurrency, "distinct": distinct,
+        "llm_latency": llm_latency, "llm_jitter": llm_jitter, "papers": papers, "wallets": wallets,
+        "payment_mode": payment_mode, "research_concurrency": research_concurrency, "base_port": base_port,
+        "trace_dir": trace_dir,
+    }
+    result = asyncio.run(run(config, _contract_bytecode(contract_bin, solc_version)))
+
+    output = output or os.path.join(ROOT, ".cache", "bench", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    _print(result)
+    logger.info(f"Results saved to {output}")
+
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), tolerance)
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+async def run(config: dict, bytecode: str) -> dict:
+    chain = LocalChain()
+    abi = load_abi(os.path.join(ROOT, "billing_agent", "contract_abi.json"))
+    address = chain.deploy(abi, bytecode, PRICE_WEI)
+    user_keys = chain.keys[1:1 + config["wallets"]]
+    if config["payment_mode"] == "voucher":
+        # Vouchers draw on a deposit held for the first user wallet
+        contract = chain.w3.eth.contract(address=address, abi=abi)
+        contract.functions.deposit().transact({"from": chain.w3.eth.accounts[1], "value": PRICE_WEI * config["requests"]})
+
+    port = config["base_port"]
+    rpc_url, user_url, billing_url, research_url = (f"http://127.0.0.1:{port + i}" for i in range(4))
+    server = uvicorn.Server(uvicorn.Config(chain.app(), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    dump, index = os.path.join(workdir, "arxiv.jsonl"), os.path.join(workdir, "arxiv_index.sqlite")
+    _write_arxiv_dump(dump, config["papers"])
+    subprocess.run([sys.executable, "research_agent/search.py", dump, "--index", index], cwd=ROOT, check=True, capture_output=True)
+
+    env = os.environ | {
+        "RPC_URL": rpc_url,
+        "CONTRACT_ADDRESS": address,
+        "PRIVATE_KEY_OWNER": chain.keys[0],
+        "PRIVATE_KEY_USER": user_keys[0],
+        "PRIVATE_KEYS_USER": ",".join(user_keys),
+        "GOOGLE_API_KEY": "bench",
+        "BENCH_LLM_LATENCY": str(config["llm_latency"]),
+        "BENCH_LLM_JITTER": str(config["llm_jitter"]),
+    }
+    store = lambda name: ["--task-store", os.path.join(workdir, f"{name}_tasks.sqlite")] + (
+        ["--trace-file", os.path.join(os.path.abspath(config["trace_dir"]), f"{name}.jsonl")] if config["trace_dir"] else []
+    )
+    processes = {
+        "research": _start("research", [
+            "bench/fake_llm.py", "--host", "127.0.0.1", "--port", research_url.rsplit(":", 1)[1],
+            "--search-backend", "local", "--search-index", index, *store("research"),
+            "--concurrency", str(config["research_concurrency"]), "--max-queue", str(max(100, config["requests"])),
+        ], env, workdir),
+        "billing": _start("billing", [
+            "billing_agent/__main__.py", "--host", "127.0.0.1", "--port", billing_url.rsplit(":", 1)[1],
+            "--research-agent", research_url, *store("billing"),
+            *(["--vouchers", "--settle-interval", "5"] if config["payment_mode"] == "voucher" else []),
+        ], env, workdir),
+        "user": _start("user", [
+            "user_agent/__main__.py", "--host", "127.0.0.1", "--port", user_url.rsplit(":", 1)[1],
+            "--payment-mode", config["payment_mode"], *store("user"),
+        ], env, workdir),
+    }
+    try:
+        for name, url in (("research", research_url), ("billing", billing_url), ("user", user_url)):
+            await _wait_ready(name, url, processes[name], workdir)
+        logger.info(f"Agents up, sending {config['requests']} queries {config['concurrency']} at a time (logs in {workdir})")
+
+        distinct = config["distinct"] or config["requests"]
+        queries = [f"{TOPICS[i % len(TOPICS)]} #{i % distinct}" for i in range(config["requests"])]
+        started = time.monotonic()
+        results = await drive(user_url, billing_url, queries, config["concurrency"])
+        wall = time.monotonic() - started
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+        server.should_exit = True
+        await serving
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": config,
+        "rpc_requests": chain.requests,
+        **summarize(results, wall),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _print(result: dict):
+    print(f"\n{result['completed']}/{result['requests']} completed in {result['wall_seconds']:.1f}s "
+          f"({result['throughput']:.2f} req/s), {result['rpc_requests']} RPC calls")
+    for error, count in result["errors"].items():
+        print(f"  {count} x {error}")
+    print(f"{'phase':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for phase, stats in result["latency"].items():
+        if stats["count"]:
+            print(f"{phase:<14}" + "".join(f"{stats[k]:>9.3f}" for k in ("p50", "p95", "p99", "max")))
+
+
+if __name__ == '__main__':
+    main()
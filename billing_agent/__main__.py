@@ -1,12 +1,28 @@
+import asyncio
 import click
+import contextlib
+import httpx
 import logging
-import uvicorn
+import os
+import sys
+
+# common/ lives at the repository root, next to this agent's directory
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from a2a.server.apps import A2AStarletteApplication
-from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
+from a2a.server.tasks import InMemoryPushNotifier
 from a2a.types import AgentCapabilities, AgentCard, AgentSkill
+from starlette.middleware import Middleware
+
+from common.metrics import METRICS, MetricsMiddleware, observe_peer
+from common.push import PushRequestHandler
+from common.remote import PEER_MODES, PushReceiver
+from common.serving import serve
+from common.task_store import SqliteTaskStore
+from common.tracing import setup_tracing
+
 from agent_executor import BillingAgentExecutor
+from invoices import InvoiceStore
 
 
 logging.basicConfig()
@@ -17,8 +33,49 @@ logging.basicConfig()
 @click.option(                                # set to research_agent's actual URL
     '--research-agent', 'research_agent', default='http://localhost:10002'
 )
+@click.option(                                # how to follow tasks on remote agents
+    '--peer-mode', 'peer_mode', type=click.Choice(PEER_MODES), default='stream'
+)
+@click.option('--max-connections', 'max_connections', default=20)  # per remote agent
+@click.option('--http2/--no-http2', default=False)  # requires the 'h2' package
+@click.option(                                # public URL for push callbacks, defaults to http://host:port
+    '--callback-url', 'callback_url', default=None
+)
+@click.option(                                # verify payments from indexed PaymentReceived events
+    '--payment-index/--no-payment-index', 'payment_index', default=True
+)
+@click.option('--payment-wait', 'payment_wait', default=10.0)  # seconds to wait for a payment to be indexed
+@click.option('--vouchers/--no-vouchers', default=False)        # accept prepaid vouchers, requires PRIVATE_KEY_OWNER
+@click.option('--settle-interval', 'settle_interval', default=300.0)  # seconds between voucher settlements
+@click.option('--settle-batch', 'settle_batch', default=50)     # vouchers per settlement transaction
+@click.option('--speculate', 'speculate', default=0)            # research jobs started before payment (0 = off)
+@click.option('--speculate-ttl', 'speculate_ttl', default=300.0)  # seconds an unpaid speculative result is kept
+@click.option(                                # task history, ":memory:" or a SQLite file
+    '--task-store', 'task_store_path', default='.cache/billing_tasks.sqlite'
+)
+@click.option('--task-ttl', 'task_ttl', default=24 * 3600)  # seconds finished tasks are kept
+@click.option('--pending-task-ttl', 'pending_task_ttl', default=7 * 24 * 3600)  # seconds unfinished tasks are kept
+@click.option(                                # open invoices, ":memory:" or a SQLite file
+    '--invoice-store', 'invoice_store_path', default=':memory:'
+)
+@click.option('--invoice-ttl', 'invoice_ttl', default=3600)  # seconds an unpaid invoice stays valid
+@click.option('--workers', default=1)         # server processes, sharing the task and invoice stores
+@click.option('--trace-file', 'trace_file', default=None)  # spans as JSONL, e.g. .cache/traces/billing.jsonl
+@click.option('--trace-otlp', 'trace_otlp', default=None)  # OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces
 
-def main(host, port, research_agent):
+def main(
+    host, port, research_agent, peer_mode, max_connections, http2, callback_url,
+    payment_index, payment_wait, vouchers, settle_interval, settle_batch, speculate, speculate_ttl,
+    task_store_path, task_ttl, pending_task_ttl, invoice_store_path, invoice_ttl, workers,
+    trace_file, trace_otlp,
+):
+    if workers > 1:
+        if ':memory:' in (task_store_path, invoice_store_path):
+            raise click.UsageError("--workers needs --task-store and --invoice-store files the workers can share")
+        if vouchers or peer_mode == 'push' or speculate:
+            # Voucher balances, push callback inboxes and speculative results are kept per process,
+            # and the payment for an invoice may arrive at a different worker than the one that issued it
+            raise click.UsageError("--vouchers, --peer-mode push and --speculate need a single worker")
     # 1. 스킬 메타데이터 설정
     skill = AgentSkill(
         id="manage_contract",
@@ -36,19 +93,57 @@ def main(host, port, research_agent):
         version="1.0.0",
         defaultInputModes=['text'],
         defaultOutputModes=['text'],
-        capabilities=AgentCapabilities(streaming=True),
+        capabilities=AgentCapabilities(streaming=True, pushNotifications=True),
         skills=[skill]
     )
     # 3. 에이전트 서버 실행
-    request_handler = DefaultRequestHandler(
-        agent_executor=BillingAgentExecutor(agent_card, research_agent),
-        task_store=InMemoryTaskStore(),
-    )
-    server = A2AStarletteApplication(
-        agent_card=agent_card,
-        http_handler=request_handler
-    )
-    uvicorn.run(server.build(), host=host, port=port)
+    # Each worker process builds its own app; state they share lives in SQLite files
+    def build_app():
+        tracer_provider = setup_tracing("billing-agent", trace_file, trace_otlp)
+        receiver = PushReceiver(callback_url or f'http://{host}:{port}') if peer_mode == 'push' else None
+        agent_executor = BillingAgentExecutor(
+            agent_card, research_agent, peer_mode, payment_index, payment_wait,
+            vouchers, dict(settle_interval=settle_interval, batch_size=settle_batch), speculate, speculate_ttl,
+            InvoiceStore(invoice_store_path, ttl=invoice_ttl, shared=workers > 1),
+            max_connections=max_connections, http2=http2, receiver=receiver, on_send=observe_peer,
+        )
+        push_client = httpx.AsyncClient(timeout=10)
+        task_store = SqliteTaskStore(task_store_path, ttl=task_ttl, pending_ttl=pending_task_ttl, shared=workers > 1)
+        METRICS.collect("task_store", lambda: asyncio.to_thread(task_store.stats))
+        METRICS.collect("invoices", agent_executor.invoices.stats)
+        METRICS.collect("research_calls", agent_executor.flights.stats)
+        for name, component in (
+            ("payment_index", agent_executor.payments),
+            ("vouchers", agent_executor.vouchers),
+            ("speculation", agent_executor.speculative),
+        ):
+            if component:
+                METRICS.collect(name, component.stats)
+        request_handler = PushRequestHandler(
+            agent_executor=agent_executor,
+            task_store=task_store,
+            push_notifier=InMemoryPushNotifier(push_client),
+        )
+        server = A2AStarletteApplication(
+            agent_card=agent_card,
+            http_handler=request_handler
+        )
+        # Payment indexing and voucher settlement run while the server is up;
+        # pending vouchers are settled and remote agent connections closed on shutdown
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            await agent_executor.start()
+            METRICS.start()
+            yield
+            await METRICS.stop()
+            await agent_executor.aclose()
+            await task_store.close()
+            await push_client.aclose()
+            if tracer_provider:
+                tracer_provider.shutdown()
+        routes = [METRICS.route()] + ([receiver.route()] if receiver else [])
+        return server.build(routes=routes, middleware=[Middleware(MetricsMiddleware)], lifespan=lifespan)
+    serve(build_app, host, port, workers)
 
 
 if __name__ == '__main__':
@@ -1,40 +1,50 @@
-import asyncio, httpx, json, logging, os, time
+import json, logging, os
 from dotenv import load_dotenv
 from uuid import uuid4
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
 
-from google.adk.events import Event, EventActions
-from google.adk.sessions import InMemorySessionService
-
-from a2a.client import A2AClient
+from a2a.client import A2AClientError
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events.event_queue import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
-    AgentCard, Message, MessageSendParams, SendMessageRequest,
-    GetTaskRequest, GetTaskSuccessResponse, TaskState, TaskQueryParams,
+    AgentCard, Message, Task, TaskArtifactUpdateEvent, TaskState, TaskStatusUpdateEvent,
     Part, TextPart, UnsupportedOperationError,
 )
+from a2a.utils import get_message_text
 from a2a.utils.errors import ServerError
+from opentelemetry import trace
+
+from common.metrics import EXECUTIONS, RpcMetrics
+from common.remote import RemoteAgentPool, UpdateEvent
+from common.singleflight import SingleFlight
+from common.tracing import extract
+
+from invoices import InvoiceStore
+from payment_index import PaymentIndexer
+from speculation import SPECULATION_TTL, SpeculativeJobs
+from vouchers import VoucherLedger
 
 
 # ────────────────── blockchain / contract config ──────────────────
 load_dotenv()
 
-WORLDLAND_RPC_URL = "https://seoul.worldland.foundation/"
-w3 = Web3(Web3.HTTPProvider(WORLDLAND_RPC_URL))
+WORLDLAND_RPC_URL = os.getenv("RPC_URL", "https://seoul.worldland.foundation/")
+w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(WORLDLAND_RPC_URL))
+w3.middleware_onion.add(RpcMetrics)
 
 with open("billing_agent/contract_abi.json", "r") as f:
     CONTRACT_ABI = json.load(f)
 CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
+PRIVATE_KEY_OWNER = os.getenv("PRIVATE_KEY_OWNER")  # contract owner, settles prepaid vouchers
+PRIORITY_TOKEN    = os.getenv("PRIORITY_TOKEN")     # lets the research agent trust our paid priority
 PRICE_WEI        = 10**18  # 1 WLC example
+PAYMENT_WAIT     = 10      # seconds to wait for a payment to show up in the index
 contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
 
-GLOBAL_SESSION_SERVICE = InMemorySessionService()
-POLL_DELAY = 3  # seconds
-
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+tracer = trace.get_tracer(__name__)
 
 
 # ────────────────── executor ──────────────────
@@ -47,13 +57,46 @@ class BillingAgentExecutor(AgentExecutor):
     """
 
     # Initialization
-    def __init__(self, agent_card, research_agent_url):
+    def __init__(
+        self, agent_card, research_agent_url, peer_mode="stream",
+        payment_index=True, payment_wait=PAYMENT_WAIT, vouchers=False, settle_options=None,
+        speculate=0, speculate_ttl=SPECULATION_TTL, invoices: InvoiceStore | None = None, **pool_options,
+    ):
         self.app_name = agent_card.name
         self.research_agent_endpoint = research_agent_url
-        self.session_service = GLOBAL_SESSION_SERVICE
+        self.remotes = RemoteAgentPool(peer_mode, **pool_options)
+        self.flights: SingleFlight[Task | None] = SingleFlight()
+        self.invoices = invoices or InvoiceStore()
+        self.payments = PaymentIndexer(w3, contract) if payment_index else None
+        self.payment_wait = payment_wait
+        self.vouchers = None
+        if vouchers:
+            if not PRIVATE_KEY_OWNER:
+                raise ValueError("PRIVATE_KEY_OWNER must be set to accept vouchers")
+            self.vouchers = VoucherLedger(w3, contract, PRIVATE_KEY_OWNER, **(settle_options or {}))
+        # Research for issued invoices starts right away when speculation is on
+        self.speculative = None
+        if speculate:
+            self.speculative = SpeculativeJobs(
+                lambda user_query, on_update: self._call_research_agent(user_query, on_update, "speculative"),
+                speculate, speculate_ttl,
+            )
+        self.chain_id: int | None = None
+
+    async def start(self):
+        await self.invoices.start()
+        if self.payments:
+            await self.payments.start()
+        if self.vouchers:
+            await self.vouchers.start()
     
     # Core pipeline
     async def execute(self, context: RequestContext, event_queue: EventQueue):
+        # Continues the trace the user agent started, if it sent one along
+        with tracer.start_as_current_span("billing.execute", context=extract(context.message.metadata)), EXECUTIONS.track_inprogress():
+            await self._execute(context, event_queue)
+
+    async def _execute(self, context: RequestContext, event_queue: EventQueue):
         updater = TaskUpdater(event_queue, context.task_id, context.context_id)
         if not context.current_task:
             updater.submit()
@@ -63,127 +106,200 @@ class BillingAgentExecutor(AgentExecutor):
         if not parts or not isinstance(parts[0].root, TextPart):
             return self._update_fail(updater, "Malformed request")
         
-        session = await self._get_session(context)
-        invoices = session.state.get("invoices", {})
-
         # ---------------- first request ----------------
         # Expecting: query
         if len(parts) == 1:
             logger.debug("FIRST REQUEST")
             query = parts[0].root.text.strip()
 
-            if query not in invoices:
-                # treat as fresh query
-                content_id = str(uuid4())
-                invoices[content_id] = query
-
-                await self.session_service.append_event(
-                    session,
-                    Event(
-                        invocation_id=str(uuid4()),
-                        author=self.app_name,
-                        timestamp=time.time(),
-                        actions=EventActions(state_delta={"invoices": invoices}),
-                    ),
-                )
+            # treat as fresh query
+            with tracer.start_as_current_span("billing.invoice_issue"):
+                content_id = self.invoices.issue(context.task_id, query)
+
                 self._update_status(updater, "Sending invoice...")
                 invoice = {
                     "contract": CONTRACT_ADDRESS,
-                    "chainId": w3.eth.chain_id,
+                    "chainId": await self._get_chain_id(),
                     "priceWei": PRICE_WEI,
                     "contentId": content_id,
                     "abi": CONTRACT_ABI,
+                    "vouchers": self.vouchers is not None,
                 }
-                updater.update_status(
-                    TaskState.input_required,
-                    message=updater.new_agent_message(
-                        [Part(TextPart(text=json.dumps(invoice)))]
-                    ),
-                )
+            updater.update_status(
+                TaskState.input_required,
+                message=updater.new_agent_message(
+                    [Part(TextPart(text=json.dumps(invoice)))]
+                ),
+            )
+            if self.speculative:
+                self.speculative.start(content_id, query)
         
         # ---------------- second request ----------------
-        # Expecting: content_id, payer_address
-        elif len(parts) == 2:
+        # Expecting: content_id, payer_address[, voucher_signature]
+        elif len(parts) in (2, 3):
             logger.debug("SECOND REQUEST")
             content_id = parts[0].root.text.strip()
             payer_addr = parts[1].root.text.strip()
+            signature  = parts[2].root.text.strip() if len(parts) == 3 else None
 
-            user_query = invoices.get(content_id)
-            if not user_query:
+            # Only the task that issued the invoice can redeem it
+            invoice = self.invoices.get(content_id)
+            if not invoice or invoice["task_id"] != context.task_id:
                 return self._update_fail(updater, "Unknown contentId")
+            user_query = invoice["query"]
 
             # 1) Verify payment
+            # A prepaid voucher is checked locally and settled on-chain later
             self._update_status(updater, "Verifying payment...")
-            if not await asyncio.to_thread(self._paid, payer_addr, content_id):
-                return self._update_fail(updater, "Payment not found on-chain")
+            with tracer.start_as_current_span("billing.verify_payment"):
+                if signature is not None:
+                    if self.vouchers is None:
+                        return self._update_fail(updater, "Vouchers not accepted")
+                    with tracer.start_as_current_span("billing.voucher_redeem"):
+                        error = await self.vouchers.redeem(payer_addr, content_id, PRICE_WEI, signature)
+                    if error:
+                        return self._update_fail(updater, error)
+                elif not await self._verify_payment(payer_addr, content_id):
+                    return self._update_fail(updater, "Payment not found on-chain")
 
             # 2) Call research agent
+            # A speculative result held in escrow is released now; otherwise
+            # artifacts are relayed to the user as soon as they arrive
             self._update_status(updater, "Payment confirmed. Fetching content...")
-            content_parts = await self._call_research_agent(user_query)
-            if content_parts is None:
+            with tracer.start_as_current_span("billing.research") as span:
+                task = await self._claim_speculative(content_id, updater)
+                span.set_attribute("research.speculative", task is not None)
+                if task is None:
+                    task = await self._call_research_agent(user_query, self._forward(updater), "paid")
+            if task is None or task.status.state != TaskState.completed or not task.artifacts:
+                # The user may retry with the same voucher, unless it is already being settled
+                if signature is not None:
+                    self.vouchers.release(payer_addr, content_id)
                 return self._update_fail(updater, "Research agent failed")
             
             # 3) Reply to user
-            updater.add_artifact(content_parts)
             updater.complete()
             logger.debug(f"Task completed")
 
             # 4) Remove fulfilled invoice
-            invoices.pop(content_id, None)
-            await self.session_service.append_event(
-                session,
-                Event(
-                    invocation_id=str(uuid4()),
-                    author=self.app_name,
-                    timestamp=time.time(),
-                    actions=EventActions(state_delta={"invoices": invoices}),
-                ),
-            )
+            self.invoices.fulfil(content_id)
+            if self.payments:
+                self.payments.forget(payer_addr, content_id)
         else:
             return self._update_fail(updater, "Unexpected number of parts")
 
 
     # Helper functions
-    def _paid(self, payer_addr: str, content_id: str) -> bool:
-        return contract.functions.paidContent(payer_addr, Web3.keccak(text=content_id)).call()
+    async def _verify_payment(self, payer_addr: str, content_id: str) -> bool:
+        """Checks the payment index first and only falls back to an eth_call if it never shows up"""
+        if self.payments:
+            with tracer.start_as_current_span("billing.payment_index_wait"):
+                if await self.payments.wait_for(payer_addr, content_id, self.payment_wait):
+                    return True
+            logger.debug("Payment not indexed in time, querying contract")
+        return await self._paid(payer_addr, content_id)
+
+    async def _paid(self, payer_addr: str, content_id: str) -> bool:
+        with tracer.start_as_current_span("billing.paid_call"):
+            return await contract.functions.paidContent(payer_addr, Web3.keccak(text=content_id)).call()
+
+    async def _get_chain_id(self) -> int:
+        if self.chain_id is None:
+            self.chain_id = await w3.eth.chain_id
+        return self.chain_id
     
-    async def _call_research_agent(self, user_query: str):
-        async with httpx.AsyncClient(timeout=60) as httpx_client:
-            client = A2AClient(httpx_client=httpx_client, url=self.research_agent_endpoint)
-            send_req = SendMessageRequest(
-                id=str(uuid4()),
-                params=MessageSendParams(
-                    message=Message(
-                        contextId=str(uuid4()),
-                        role="user",
-                        messageId=str(uuid4()),
-                        parts=[Part(TextPart(text=user_query))]
-                    )
-                )
+    async def _claim_speculative(self, content_id: str, updater: TaskUpdater) -> Task | None:
+        """
+        Waits for the speculative job of a paid invoice, relaying its progress, and releases its
+        artifacts if it succeeded. A job still queued at speculative priority is given up, so the
+        caller asks again at paid priority.
+        """
+        job = self.speculative.claim(content_id, self._forward(updater)) if self.speculative else None
+        if job is None:
+            return None
+        try:
+            task = await job
+        except Exception as e:
+            logger.error(f"Speculative research failed: {e}")
+            return None
+        if task is None or task.status.state != TaskState.completed or not task.artifacts:
+            return None
+        for artifact in task.artifacts:
+            updater.add_artifact(artifact.parts, artifact.artifactId, artifact.name, artifact.metadata)
+        return task
+
+    async def _call_research_agent(self, user_query: str, on_update, priority: str) -> Task | None:
+        """
+        Asks the research agent for a report; `priority` orders the request in its queue.
+        An identical query already on its way with the same priority is shared rather than
+        sent again: its progress is relayed from then on, and its artifacts once it is done.
+        """
+        key = f"{priority}:{' '.join(user_query.lower().split())}"
+        def relay(event: UpdateEvent):
+            if on_update and isinstance(event, TaskStatusUpdateEvent):
+                on_update(event)
+        task, joined = await self.flights.run(
+            key, lambda emit: self._send_research_query(user_query, on_update, priority, emit), relay,
+        )
+        trace.get_current_span().set_attribute("research.joined", joined)
+        if joined and task is None:
+            # The shared call failed or was cancelled, so make our own
+            return await self._send_research_query(user_query, on_update, priority)
+        if joined and on_update:
+            for artifact in task.artifacts or []:
+                on_update(TaskArtifactUpdateEvent(taskId=task.id, contextId=task.contextId, artifact=artifact))
+        return task
+
+    async def _send_research_query(self, user_query: str, on_update, priority: str, emit=None) -> Task | None:
+        remote = self.remotes.get(self.research_agent_endpoint)
+        def track(event: UpdateEvent):
+            if on_update:
+                on_update(event)
+            if emit:
+                emit(event)
+        metadata = {"priority": priority}
+        if PRIORITY_TOKEN:
+            metadata["priority_token"] = PRIORITY_TOKEN
+        try:
+            return await remote.send(
+                Message(
+                    contextId=str(uuid4()),
+                    role="user",
+                    messageId=str(uuid4()),
+                    parts=[Part(TextPart(text=user_query))],
+                    metadata=metadata,
+                ),
+                track,
             )
-            resp = await client.send_message(send_req)
-            if not hasattr(resp.root, "result") or not hasattr(resp.root.result, "id"):
-                return None
-            task_id = resp.root.result.id
-            # poll
-            while True:
-                await asyncio.sleep(POLL_DELAY)
-                tg_resp = await client.get_task(
-                    GetTaskRequest(
-                        id=str(uuid4()),
-                        params=TaskQueryParams(id=task_id)
-                    )
-                )
-                if not isinstance(tg_resp.root, GetTaskSuccessResponse):
-                    return None
-                task = tg_resp.root.result
-                if task.status.state == TaskState.completed and task.artifacts:
-                    return task.artifacts[0].parts
-                if task.status.state == TaskState.failed:
-                    return None
+        except A2AClientError as e:
+            logger.error(f"Research agent call failed: {e}")
+            return None
     
+    def _forward(self, updater: TaskUpdater):
+        """Relays progress and artifacts of the research task to the user's task"""
+        def on_update(event: UpdateEvent):
+            if isinstance(event, TaskArtifactUpdateEvent):
+                artifact = event.artifact
+                updater.add_artifact(artifact.parts, artifact.artifactId, artifact.name, artifact.metadata)
+            elif event.status.state == TaskState.working and event.status.message:
+                text = get_message_text(event.status.message)
+                if text:
+                    self._update_status(updater, text)
+        return on_update
+
     async def cancel(self, *_):
         raise ServerError(error=UnsupportedOperationError())
+
+    async def aclose(self):
+        if self.payments:
+            await self.payments.stop()
+        if self.vouchers:
+            await self.vouchers.stop()
+        if self.speculative:
+            await self.speculative.aclose()
+        await self.invoices.stop()
+        await self.remotes.aclose()
+        await w3.provider.disconnect()
     
     def _update_status(self, updater: TaskUpdater, msg: str):
         updater.update_status(TaskState.working, message=self._msg(updater, msg))
@@ -194,15 +310,3 @@ class BillingAgentExecutor(AgentExecutor):
     def _msg(self, updater: TaskUpdater, txt: str):
         logger.debug(txt)
         return updater.new_agent_message([Part(TextPart(text=txt))])
-
-    async def _get_session(self, context: RequestContext):
-        session = await self.session_service.get_session(
-            app_name=self.app_name, 
-            user_id="anonymous", 
-            session_id=context.task_id, 
-        ) or await self.session_service.create_session(
-            app_name=self.app_name, 
-            user_id="anonymous", 
-            session_id=context.task_id, 
-        )
-        return session
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio, logging, os, sqlite3, time
+from uuid import uuid4
+
+
+INVOICE_TTL = 3600    # seconds an unpaid invoice stays valid
+SWEEP_INTERVAL = 60   # seconds between sweeps for expired invoices
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── invoice store ──────────────────
+class InvoiceStore:
+    """
+    Open invoices indexed by content id
+
+    Each invoice records the query it was issued for and the task that issued
+    it. Invoices are dropped when fulfilled, or `ttl` seconds after issue by a
+    background sweeper. With a file `path` (anything but ":memory:") open
+    invoices are also written to SQLite and reloaded on restart; with `shared`
+    as well, lookups go to that file so several processes can share it.
+    """
+
+    def __init__(
+        self, path: str = ":memory:", ttl: float = INVOICE_TTL, sweep_interval: float = SWEEP_INTERVAL,
+        shared: bool = False,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.shared = shared and path != ":memory:"
+        self.issued = self.fulfilled = self.expired = 0
+        self.bytes = 0  # size of the stored queries
+        self._invoices: dict[str, dict] = {}  # content id -> {"query", "task_id", "created"}
+        self._task: asyncio.Task | None = None
+        self._db = None
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                "content_id TEXT PRIMARY KEY, query TEXT NOT NULL, task_id TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            rows = self._db.execute("SELECT content_id, query, task_id, created FROM invoices ORDER BY created")
+            for content_id, query, task_id, created in rows:
+                self._invoices[content_id] = {"query": query, "task_id": task_id, "created": created}
+                self.bytes += len(query.encode())
+            self._sweep()
+
+    def issue(self, task_id: str, query: str) -> str:
+        """Opens an invoice for `query` and returns its content id"""
+        content_id = str(uuid4())
+        invoice = {"query": query, "task_id": task_id, "created": time.time()}
+        self._invoices[content_id] = invoice
+        self.bytes += len(query.encode())
+        if self._db:
+            self._db.execute(
+                "INSERT INTO invoices (content_id, query, task_id, created) VALUES (?, ?, ?, ?)",
+                (content_id, query, task_id, invoice["created"]),
+            )
+        self.issued += 1
+        return content_id
+
+    def get(self, content_id: str) -> dict | None:
+        if self.shared:
+            row = self._db.execute(
+                "SELECT query, task_id, created FROM invoices WHERE content_id = ?", (content_id,)
+            ).fetchone()
+            invoice = dict(zip(("query", "task_id", "created"), row)) if row else None
+        else:
+            invoice = self._invoices.get(content_id)
+        if invoice is None or time.time() - invoice["created"] > self.ttl:
+            return None
+        return invoice
+
+    def fulfil(self, content_id: str):
+        if self.shared:
+            self._db.execute("DELETE FROM invoices WHERE content_id = ?", (content_id,))
+        if self._remove(content_id) or self.shared:
+            self.fulfilled += 1
+
+    def stats(self) -> dict:
+        return {
+            "open": len(self._invoices),
+            "bytes": self.bytes,
+            "issued": self.issued,
+            "fulfilled": self.fulfilled,
+            "expired": self.expired,
+        }
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._db:
+            self._db.close()
+
+    # Helper functions
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self._sweep()
+
+    def _sweep(self):
+        # Invoices are kept in issue order, so the expired ones are all at the front
+        cutoff = time.time() - self.ttl
+        expired = []
+        for content_id, invoice in self._invoices.items():
+            if invoice["created"] >= cutoff:
+                break
+            expired.append(content_id)
+        for content_id in expired:
+            self._remove(content_id)
+        if self.shared:
+            # Also those issued by other processes
+            self._db.execute("DELETE FROM invoices WHERE created < ?", (cutoff,))
+        self.expired += len(expired)
+        if expired:
+            logger.debug(f"Expired {len(expired)} unpaid invoices")
+
+    def _remove(self, content_id: str) -> bool:
+        invoice = self._invoices.pop(content_id, None)
+        if invoice is None:
+            return False
+        self.bytes -= len(invoice["query"].encode())
+        if self._db:
+            self._db.execute("DELETE FROM invoices WHERE content_id = ?", (content_id,))
+        return True
@@ -0,0 +1,116 @@
+import asyncio, logging, time
+from web3 import AsyncWeb3, Web3
+
+
+POLL_INTERVAL = 2     # seconds between checks for new blocks
+MAX_BACKOFF = 60      # seconds between retries while the RPC node keeps failing
+MAX_BLOCK_RANGE = 1000  # blocks per eth_getLogs call
+
+logger = logging.getLogger(__name__)
+
+
+def payment_key(payer_addr: str, content_id: str) -> tuple[str, bytes]:
+    return payer_addr.lower(), bytes(Web3.keccak(text=content_id))
+
+
+# ────────────────── indexer ──────────────────
+class PaymentIndexer:
+    """
+    Follows PaymentReceived logs of the billing contract into a local index
+
+    Payments are keyed by (payer, contentId) so verifying one is a dict lookup
+    instead of a `paidContent` eth_call, and `wait_for()` lets a request await
+    a payment that has not been indexed yet. Until the first poll succeeds
+    nothing is indexed, and callers are expected to ask the contract instead.
+    """
+
+    def __init__(
+        self, w3: AsyncWeb3, contract, poll_interval: float = POLL_INTERVAL,
+        backfill_blocks: int = 1000, retention: float = 24 * 3600,
+    ):
+        self.w3 = w3
+        self.contract = contract
+        self.poll_interval = poll_interval
+        self.backfill_blocks = backfill_blocks
+        self.retention = retention
+        self.next_block: int | None = None
+        self._payments: dict[tuple[str, bytes], float] = {}  # key -> time indexed
+        self._waiters: dict[tuple[str, bytes], set[asyncio.Future]] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        # The first block is looked up in the background, so an RPC outage doesn't keep the agent from starting
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def paid(self, payer_addr: str, content_id: str) -> bool:
+        return payment_key(payer_addr, content_id) in self._payments
+
+    async def wait_for(self, payer_addr: str, content_id: str, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for the payment to be indexed"""
+        key = payment_key(payer_addr, content_id)
+        if key in self._payments:
+            return True
+        if self.next_block is None:
+            return False  # not synced yet
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, set()).add(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def forget(self, payer_addr: str, content_id: str):
+        """Drops a payment whose content has been delivered"""
+        self._payments.pop(payment_key(payer_addr, content_id), None)
+
+    # Helper functions
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self._poll()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Payment indexer poll failed ({failures} in a row): {e}")
+            self._prune()
+            await asyncio.sleep(min(self.poll_interval * 2 ** min(failures, 10), MAX_BACKOFF))
+
+    async def _poll(self):
+        latest = await self.w3.eth.block_number
+        if self.next_block is None:
+            self.next_block = max(latest - self.backfill_blocks, 0)
+        while self.next_block <= latest:
+            to_block = min(self.next_block + MAX_BLOCK_RANGE - 1, latest)
+            logs = await self.contract.events.PaymentReceived.get_logs(
+                from_block=self.next_block, to_block=to_block,
+            )
+            for log in logs:
+                self._add((log.args.user.lower(), bytes(log.args.contentId)))
+            self.next_block = to_block + 1
+
+    def _add(self, key: tuple[str, bytes]):
+        self._payments[key] = time.monotonic()
+        for future in self._waiters.pop(key, ()):
+            if not future.done():
+                future.set_result(True)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention
+        for key in [key for key, indexed in self._payments.items() if indexed < cutoff]:
+            del self._payments[key]
+
+    def stats(self) -> dict:
+        return {"payments": len(self._payments), "waiters": len(self._waiters), "next_block": self.next_block}
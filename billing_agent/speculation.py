@@ -0,0 +1,106 @@
+import asyncio, logging
+from typing import Awaitable, Callable
+
+from a2a.types import Task, TaskStatusUpdateEvent
+
+
+SPECULATION_TTL = 300  # seconds an unclaimed result is kept
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── speculative jobs ──────────────────
+class SpeculativeJobs:
+    """
+    Research jobs started when an invoice is issued, held in escrow until it is paid
+
+    At most `max_jobs` jobs, running or finished, are held at a time; invoices
+    beyond that budget are simply not speculated on. A job that isn't claimed
+    within `ttl` seconds is cancelled and its result discarded.
+
+    `run(user_query, on_update)` makes the research call. Its status updates
+    tell whether the research agent is still queueing the job, which it marks
+    with `queue_position` in the message metadata, or already working on it.
+    """
+
+    def __init__(
+        self, run: Callable[[str, Callable], Awaitable[Task | None]], max_jobs: int, ttl: float = SPECULATION_TTL,
+    ):
+        self.run = run
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: dict[str, _Job] = {}
+        self.started = self.claimed = self.requeued = self.expired = 0
+
+    def start(self, content_id: str, user_query: str) -> bool:
+        if len(self._jobs) >= self.max_jobs:
+            logger.debug(f"Speculation budget exhausted, not starting job for {content_id}")
+            return False
+        job = _Job()
+        job.task = asyncio.create_task(self.run(user_query, job.update))
+        job.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, content_id)
+        self._jobs[content_id] = job
+        self.started += 1
+        return True
+
+    def claim(self, content_id: str, on_update: Callable | None = None) -> asyncio.Task | None:
+        """
+        Hands the job for a paid invoice to the caller, who now owns its result, and passes
+        it the job's status updates from now on. A job the research agent hasn't started
+        yet is cancelled instead, so the caller can ask again at paid priority.
+        """
+        job = self._jobs.pop(content_id, None)
+        if job is None:
+            return None
+        job.expiry.cancel()
+        if not job.working and not job.task.done():
+            logger.debug(f"Speculative job for {content_id} still queued, cancelling it")
+            job.task.cancel()
+            self.requeued += 1
+            return None
+        job.on_update = on_update
+        self.claimed += 1
+        return job.task
+
+    def stats(self) -> dict:
+        return {
+            "held": len(self._jobs), "started": self.started, "claimed": self.claimed,
+            "requeued": self.requeued, "expired": self.expired,
+        }
+
+    async def aclose(self):
+        jobs = [job.task for job in self._jobs.values()]
+        for content_id in list(self._jobs):
+            self._discard(content_id)
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    # Helper functions
+    def _expire(self, content_id: str):
+        logger.debug(f"Discarding unclaimed speculative result for {content_id}")
+        self.expired += 1
+        self._discard(content_id)
+
+    def _discard(self, content_id: str):
+        job = self._jobs.pop(content_id)
+        job.expiry.cancel()
+        job.task.cancel()
+
+
+class _Job:
+    """A speculative research call, whether the research agent is working on it yet, and who follows its progress"""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.expiry: asyncio.TimerHandle | None = None
+        self.working = False
+        self.on_update: Callable | None = None
+
+    def update(self, event):
+        # Artifacts are released from the finished task, so only progress is passed on
+        if not isinstance(event, TaskStatusUpdateEvent):
+            return
+        message = event.status.message
+        if not (message and "queue_position" in (message.metadata or {})):
+            self.working = True
+        if self.on_update:
+            self.on_update(event)
@@ -0,0 +1,167 @@
+import asyncio, logging, time
+from collections import defaultdict
+from eth_account import Account
+from hexbytes import HexBytes
+from web3 import AsyncWeb3, Web3
+
+from common.vouchers import recover_voucher_signer
+
+
+SETTLE_INTERVAL = 300  # seconds between settlement batches
+SETTLE_BATCH = 50      # vouchers per settlement transaction
+BALANCE_TTL = 60       # seconds a fetched deposit balance is trusted
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── voucher ledger ──────────────────
+class VoucherLedger:
+    """
+    Accepts signed vouchers against prepaid deposits and settles them in batches
+
+    A voucher is checked locally: its signature must recover to the payer and
+    the payer's deposit, minus vouchers not yet settled, must cover it. Accepted
+    vouchers are redeemed on-chain with `settleVouchers` every `settle_interval`
+    seconds, or as soon as `batch_size` of them are waiting.
+    """
+
+    def __init__(
+        self, w3: AsyncWeb3, contract, owner_key: str,
+        settle_interval: float = SETTLE_INTERVAL, batch_size: int = SETTLE_BATCH,
+    ):
+        self.w3 = w3
+        self.contract = contract
+        self.owner = Account.from_key(owner_key)
+        self.settle_interval = settle_interval
+        self.batch_size = batch_size
+        self.chain_id: int | None = None
+        self._deposits: dict[str, tuple[int, float]] = {}   # payer -> (usable deposit, time fetched)
+        self._unsettled: dict[str, int] = defaultdict(int)  # payer -> accepted but unsettled amount
+        self._pending: list[tuple[tuple[str, bytes, int], HexBytes]] = []
+        self._seen: set[tuple[str, bytes]] = set()
+        self._settling: set[tuple[str, bytes]] = set()     # vouchers in the settlement being sent
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self.chain_id = await self.w3.eth.chain_id
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        # Don't leave accepted vouchers unredeemed
+        while self._pending:
+            if not await self._settle():
+                logger.error(f"{len(self._pending)} vouchers left unsettled")
+                break
+
+    async def redeem(self, payer_addr: str, content_id: str, amount: int, signature: str) -> str | None:
+        """Accepts a voucher for settlement; returns why it was rejected, or None"""
+        try:
+            payer = Web3.to_checksum_address(payer_addr)
+            signer = recover_voucher_signer(self.chain_id, self.contract.address, payer, content_id, amount, signature)
+        except Exception:
+            return "Malformed voucher"
+        if signer != payer:
+            return "Invalid voucher signature"
+        key = (payer, bytes(Web3.keccak(text=content_id)))
+        if key in self._seen:
+            return "Voucher already redeemed"
+
+        if await self._available(payer) < amount and await self._available(payer, refresh=True) < amount:
+            return "Insufficient prepaid balance"
+        self._seen.add(key)
+        self._unsettled[payer] += amount
+        self._pending.append(((payer, key[1], amount), HexBytes(signature)))
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return None
+
+    def release(self, payer_addr: str, content_id: str) -> bool:
+        """
+        Gives back a redeemed voucher whose content could not be delivered, so the same
+        voucher can be redeemed again; returns False if it is already being settled
+        """
+        key = (Web3.to_checksum_address(payer_addr), bytes(Web3.keccak(text=content_id)))
+        if key in self._settling:
+            return False
+        for i, ((payer, content_key, amount), _) in enumerate(self._pending):
+            if (payer, content_key) == key:
+                del self._pending[i]
+                self._seen.discard(key)
+                self._unsettled[payer] -= amount
+                if not self._unsettled[payer]:
+                    del self._unsettled[payer]
+                return True
+        return False
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "unsettled_wei": sum(self._unsettled.values())}
+
+    # Helper functions
+    async def _available(self, payer: str, refresh: bool = False) -> int:
+        cached = self._deposits.get(payer)
+        if refresh or cached is None or time.monotonic() - cached[1] > BALANCE_TTL:
+            await self._refresh(payer)
+        return self._deposits[payer][0] - self._unsettled[payer]
+
+    async def _refresh(self, payer: str):
+        deposit, withdraw_after = await asyncio.gather(
+            self.contract.functions.deposits(payer).call(),
+            self.contract.functions.withdrawAfter(payer).call(),
+        )
+        # A deposit with a withdrawal pending may be gone before its vouchers settle
+        self._deposits[payer] = (0 if withdraw_after else deposit, time.monotonic())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.settle_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            while self._pending:
+                if not await self._settle():
+                    break
+
+    async def _settle(self) -> bool:
+        """Redeems one batch of pending vouchers; returns whether the transaction went through"""
+        batch = self._pending[:self.batch_size]
+        # Released vouchers leave _pending, but never from this batch, so it stays its prefix
+        self._settling = {(payer, content_key) for (payer, content_key, _), _ in batch}
+        try:
+            txn = await self.contract.functions.settleVouchers(
+                [voucher for voucher, _ in batch], [signature for _, signature in batch]
+            ).build_transaction({
+                "from": self.owner.address,
+                "nonce": await self.w3.eth.get_transaction_count(self.owner.address, "pending"),
+                "chainId": self.chain_id,
+            })
+            txh = await self.w3.eth.send_raw_transaction(self.owner.sign_transaction(txn).raw_transaction)
+            receipt = await self.w3.eth.wait_for_transaction_receipt(txh)
+            if receipt["status"] != 1:
+                raise RuntimeError(f"transaction {txh.hex()} reverted")
+        except Exception as e:
+            logger.error(f"Settling {len(batch)} vouchers failed: {e}")
+            return False
+        finally:
+            self._settling = set()
+
+        settled = {(log.args.user, bytes(log.args.contentId)) for log in self.contract.events.PaymentReceived().process_receipt(receipt)}
+        del self._pending[:len(batch)]
+        payers = list({payer for (payer, _, _), _ in batch})
+        refreshed = await asyncio.gather(*(self._refresh(payer) for payer in payers), return_exceptions=True)
+        for (payer, content_key, amount), _ in batch:
+            self._unsettled[payer] -= amount
+            self._seen.discard((payer, content_key))
+            if (payer, content_key) not in settled:
+                logger.warning(f"Voucher of {payer} for {content_key.hex()} was rejected on-chain")
+        for payer, result in zip(payers, refreshed):
+            if isinstance(result, Exception):
+                self._deposits.pop(payer, None)  # stale now, fetch again on next use
+            if not self._unsettled[payer]:
+                del self._unsettled[payer]
+        logger.info(f"Settled {len(settled)}/{len(batch)} vouchers in {txh.hex()}")
+        return True
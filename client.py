@@ -1,14 +1,18 @@
 import gradio as gr
-import asyncio, httpx, json, logging, os, hashlib, html, threading, time
-from collections import OrderedDict
+import asyncio, atexit, json, logging, os, hashlib, html, threading, time
+from collections import OrderedDict, defaultdict
 from datetime import datetime
 from uuid import uuid4
 
-from a2a.client import A2AClient
+from a2a.client import A2AClientError
 from a2a.types import (
-    Message, MessageSendParams, SendMessageRequest, TaskQueryParams, 
-    GetTaskRequest, Part, TextPart, TaskState, 
+    Message, Part, TextPart, TaskArtifactUpdateEvent, TaskState, TaskStatusUpdateEvent,
 )
+from a2a.utils import get_message_text
+from opentelemetry import trace
+
+from common.remote import RemoteAgentPool
+from common.tracing import setup_tracing
 
 
 MY_AGENT_URL = "http://localhost:10000"         # Set to user agent's actual URL
@@ -16,165 +20,272 @@ REMOTE_AGENT_URLS = {
     "Research Agent": "http://localhost:10001", # Set to remote agent's actual URL
     "(Preparing)": "",                          # Placeholder for future agents
 }
-POLL_DELAY = 3
+
+# Kept open for the lifetime of the UI so every query reuses the same connection
+remote_agents = RemoteAgentPool(timeout=120)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Spans are exported only when TRACE_FILE (JSONL) or TRACE_OTLP (collector URL) is set
+tracer_provider = setup_tracing("client", os.getenv("TRACE_FILE"), os.getenv("TRACE_OTLP"))
+tracer = trace.get_tracer(__name__)
+
 
 # ────────────────── session management ──────────────────
-MAX_SESSIONS = 100
-sessions = OrderedDict()
-session_lock = threading.Lock()
+MAX_SESSIONS = int(os.getenv("CLIENT_MAX_SESSIONS", 1000))              # sessions kept in memory, least recently used go first
+SESSION_MESSAGES = int(os.getenv("CLIENT_SESSION_MESSAGES", 40))        # recent messages kept in memory per session
+SESSION_CHARS = int(os.getenv("CLIENT_SESSION_CHARS", 256 * 2**10))     # ... and at most this many characters of them
+
+class SessionStore:
+    """
+    Chat histories of the UI's sessions, bounded in memory
+
+    Every message is appended to the chat log on disk, and each session keeps
+    only its latest `max_messages` messages, up to `max_chars`, in memory;
+    older ones spill out and stay in the log. Beyond `max_sessions`, the least
+    recently used session is dropped. Handlers call it from the event loop and
+    no method awaits, so it needs no lock.
+    """
+
+    def __init__(self, log: "ChatLog", max_sessions: int = MAX_SESSIONS, max_messages: int = SESSION_MESSAGES, max_chars: int = SESSION_CHARS):
+        self.log = log
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+
+    def history(self, session_id: str) -> list[dict]:
+        """Messages to show, with a note in place of those that spilled to the log"""
+        session = self._get(session_id)
+        if not session["spilled"]:
+            return list(session["messages"])
+        note = {"role": "assistant", "content": f"*{session['spilled']} earlier messages are saved in the chat log.*"}
+        return [note, *session["messages"]]
+
+    def add(self, session_id: str, messages: list[dict]):
+        self.log.append(session_id, messages)
+        session = self._get(session_id)
+        session["messages"].extend(messages)
+        session["chars"] += sum(len(message["content"]) for message in messages)
+        # The latest turn always stays, however large
+        while len(session["messages"]) > max(self.max_messages, len(messages)) or (
+            session["chars"] > self.max_chars and len(session["messages"]) > len(messages)
+        ):
+            session["chars"] -= len(session["messages"].pop(0)["content"])
+            session["spilled"] += 1
+
+    def reset(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._get(session_id)
+        print(f"♻️ Session {session_id[:8]}... reset.")
+
+    # Helper functions
+    def _get(self, session_id: str) -> dict:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+        if len(self._sessions) >= self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            print(f"🧹 Removed LRU session: {evicted_id[:8]}...")
+        session = self._sessions[session_id] = {"messages": [], "chars": 0, "spilled": 0}
+        print(f"✅ New session created: {session_id[:8]}... | Total sessions: {len(self._sessions)}")
+        return session
+
 
 def get_session_id(request: gr.Request):
     """Generate unique session ID"""
     raw_id = request.client.host + str(request.headers.get("user-agent"))
     return hashlib.sha256(raw_id.encode()).hexdigest()
 
-def init_session(session_id: str):
-    """Initialize session with empty chat history"""
-    if len(sessions) >= MAX_SESSIONS:
-        evicted_id, _ = sessions.popitem(last=False)
-        print(f"🧹 Removed LRU session: {evicted_id[:8]}...")
-    sessions[session_id] = {
-        "chat_history": [],
-    }
-
-def reset_session(request: gr.Request):
+async def reset_session(request: gr.Request):
     """Reset current session by clearing chat history"""
-    session_id = get_session_id(request)
-    with session_lock:
-        init_session(session_id)
-        sessions.move_to_end(session_id)
-        print(f"♻️ Session {session_id[:8]}... reset.")
+    sessions.reset(get_session_id(request))
     return "", []
 
 
 # ────────────────── run client ──────────────────
-async def run_client(query, remote_url, my_url=MY_AGENT_URL):
+async def run_client(query, remote_url, my_url=MY_AGENT_URL, on_update=None):
     """
-    Connects to the UserAgent, sends a query, and polls for the result.
+    Connects to the UserAgent, sends a query, and follows the task until it finishes.
+    Streams updates when the UserAgent supports it, polls otherwise.
+    Status and artifact events are also passed to `on_update` as they arrive.
     """
-    try:
-        async with httpx.AsyncClient(timeout=120) as httpx_client:
-            client = A2AClient(httpx_client=httpx_client, url=my_url)
+    def track(event):
+        log_update(event)
+        if on_update:
+            on_update(event)
+
+    # The trace started here follows the query through every agent it reaches
+    with tracer.start_as_current_span("client.query", attributes={"remote_url": remote_url}) as span:
+        if span.is_recording():
+            logger.info(f"Trace id: {span.get_span_context().trace_id:032x}")
+        try:
+            agent = remote_agents.get(my_url)
             # 1. Send the initial query to the UserAgent
             logger.info(f"Sending query: '{query}' to {my_url}")
-            send_request = SendMessageRequest(
-                id=str(uuid4()),
-                params=MessageSendParams(
-                    message=Message(
-                        role="user",
-                        messageId=str(uuid4()),
-                        parts=[
-                            Part(TextPart(text=query)),
-                            Part(TextPart(text=remote_url)),
-                        ]
-                    )
-                )
+            task = await agent.send(
+                Message(
+                    role="user",
+                    messageId=str(uuid4()),
+                    parts=[
+                        Part(TextPart(text=query)),
+                        Part(TextPart(text=remote_url)),
+                    ]
+                ),
+                track,
             )
-            
-            resp = await client.send_message(send_request)
-
-            if hasattr(resp.root, "error"):
-                error_message = resp.root.error.message
-                logger.error(error_message)
-                return error_message
-
-            task = resp.root.result
-            task_id = task.id
-            logger.info(f"Task created successfully. Task ID: {task_id}")
-
-            # 2. Poll the server until the task is complete or fails
-            while True:
-                await asyncio.sleep(POLL_DELAY)
-                
-                logger.info(f"Checking status for task {task_id}...")
-                get_task_resp = await client.get_task(
-                    GetTaskRequest(
-                        id=str(uuid4()),
-                        params=TaskQueryParams(id=task_id)
-                    )
-                )
-
-                if hasattr(get_task_resp.root, "error"):
-                    error_message = get_task_resp.root.error.message
-                    logger.error(error_message)
-                    return error_message
-
-                task = get_task_resp.root.result
-                
-                if task.status.state == TaskState.completed:
-                    # The final result is stored in the task's artifacts
-                    result_text = task.artifacts[0].parts[0].root.text
-                    logger.info("Task completed!")
-                    return result_text
-                if task.status.state == TaskState.failed:
-                    error_message = task.status.message.parts[0].root.text
-                    logger.error(error_message)
-                    return error_message
-                # Display the intermediate status message from the agent
-                if task.status.message:
-                    status_update = task.status.message.parts[0].root.text
-                    logger.info(f"Status update: {status_update}")
-                else:
-                    logger.info("Task is still in progress...")
-
-    except Exception as e:
-        logger.error(f"An error occurred while connecting to the agent at {my_url}. Is it running?")
-        logger.error(f"Details: {e}")
-        return f"Exception: {str(e)}"
+            logger.info(f"Task {task.id} finished in state {task.status.state.value}")
+
+            # 2. The final result is stored in the task's artifacts
+            if task.status.state == TaskState.completed:
+                result_text = task.artifacts[0].parts[0].root.text
+                logger.info("Task completed!")
+                return result_text
+            error_message = get_message_text(task.status.message) if task.status.message else task.status.state.value
+            logger.error(error_message)
+            return error_message
+
+        except A2AClientError as e:
+            logger.error(e)
+            return str(e)
+        except Exception as e:
+            logger.error(f"An error occurred while connecting to the agent at {my_url}. Is it running?")
+            logger.error(f"Details: {e}")
+            return f"Exception: {str(e)}"
+
+
+def log_update(event):
+    """Displays the intermediate status messages from the agent"""
+    if isinstance(event, TaskStatusUpdateEvent) and event.status.message:
+        logger.info(f"Status update: {get_message_text(event.status.message)}")
 
 
 # ────────────────── handle query ──────────────────
 async def handle_query(query, remote_url, request: gr.Request,):
-    """Handles user query by invoking client"""
+    """
+    Handles user query by invoking client.
+    Yields the chat as it progresses: the agent's latest status below whatever
+    part of the report has arrived, then the final answer.
+    """
     session_id = get_session_id(request)
-    # Ensure session-safe access
-    with session_lock:
-        if session_id not in sessions:
-            init_session(session_id)
-            print(f"✅ New session created: {session_id[:8]}... | Total sessions: {len(sessions)}")
-        session = sessions[session_id]
-        sessions.move_to_end(session_id)
-    
-    chat_history = session["chat_history"]
     if query == "" or remote_url == "":
-        return chat_history
+        yield sessions.history(session_id)
+        return
     
     start_time = time.time()                                         # ⏱️ TIMER
     
-    response = await run_client(query, remote_url)
+    history = sessions.history(session_id) + [{"role": "user", "content": query}]
+    yield history + [{"role": "assistant", "content": "*Sending query...*"}]
+
+    updates = asyncio.Queue()
+    job = asyncio.create_task(run_client(query, remote_url, on_update=updates.put_nowait))
+    job.add_done_callback(lambda _: updates.put_nowait(None))
+    status, artifacts = "", {}
+    try:
+        while (event := await updates.get()) is not None:
+            if isinstance(event, TaskArtifactUpdateEvent):
+                text = "".join(part.root.text for part in event.artifact.parts if isinstance(part.root, TextPart))
+                previous = artifacts.get(event.artifact.artifactId, "") if event.append else ""
+                artifacts[event.artifact.artifactId] = previous + text
+            elif event.status.state == TaskState.working and event.status.message:
+                status = get_message_text(event.status.message)
+            else:
+                continue
+            yield history + [{"role": "assistant", "content": _progress(artifacts, status)}]
+        response = job.result()
+    finally:
+        # The user left before the answer came
+        job.cancel()
 
     response = html.escape(response)
-    chat_history.append({"role": "user", "content": query})
-    chat_history.append({"role": "assistant", "content": response})
-    save_history(chat_history, session_id)
+    sessions.add(session_id, [{"role": "user", "content": query}, {"role": "assistant", "content": response}])
    
     end_time = time.time()                                           # ⏱️ TIMER
     elapsed_time = end_time - start_time                             # ⏱️ TIMER
     print(f"Responded to user query in {elapsed_time:.2f} seconds")  # ⏱️ TIMER
     
-    return chat_history
+    yield sessions.history(session_id)
 
 
-# ────────────────── save history ──────────────────
-def save_history(history, session_id):
-    """Saves chat history to JSON file with timestamp and session ID"""
-    folder = "./chat_logs"
-    os.makedirs(folder, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d")
-    filename = os.path.join(folder, f"{timestamp}_{session_id[:16]}.json")
-    counter = 1
-    while os.path.exists(filename):
-        filename = os.path.join(folder, f"{timestamp}_{session_id[:16]}_{counter}.json")
-        counter += 1
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+def _progress(artifacts: dict, status: str) -> str:
+    report = html.escape("\n\n".join(artifacts.values()))
+    status = f"*{html.escape(status)}*" if status else ""
+    return "\n\n".join(text for text in (report, status) if text)
+
+
+# ────────────────── chat log ──────────────────
+class ChatLog:
+    """
+    Append-only chat log, one JSONL file per session and day
+
+    `append()` only queues a turn's messages, so logging costs the same however
+    long the conversation gets. A background task appends queued messages to
+    `<folder>/<YYYYMMDD>_<session>.jsonl` off the event loop, every
+    `flush_interval` seconds or once `flush_size` messages are waiting.
+    Whatever is still queued when the process exits is written then.
+    """
+
+    def __init__(self, folder: str = "./chat_logs", flush_interval: float = 1.0, flush_size: int = 200):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: list[tuple[str, dict]] = []  # (file, message)
+        self._flush_needed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lock = threading.Lock()  # the exit flush may run while a batch is being written
+        atexit.register(self.close)
+
+    def append(self, session_id: str, messages: list[dict]):
+        now = datetime.now()
+        path = os.path.join(self.folder, f"{now:%Y%m%d}_{session_id[:16]}.jsonl")
+        timestamp = now.isoformat(timespec="seconds")
+        for message in messages:
+            self._pending.append((path, {"time": timestamp, **message}))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.flush_size:
+            self._flush_needed.set()
+
+    def close(self):
+        batch, self._pending = self._pending, []
+        self._write(batch)
+
+    # Helper functions
+    async def _run(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except OSError as e:
+                logger.error(f"Chat log write failed: {e}")
+
+    def _write(self, batch: list[tuple[str, dict]]):
+        if not batch:
+            return
+        files = defaultdict(list)
+        for path, message in batch:
+            files[path].append(json.dumps(message, ensure_ascii=False) + "\n")
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            for path, lines in files.items():
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+
+
+sessions = SessionStore(ChatLog())
 
 
 # ────────────────── gradio ui ──────────────────
+CONCURRENCY = int(os.getenv("CLIENT_CONCURRENCY", 100))  # queries handled at once
+MAX_QUEUE = int(os.getenv("CLIENT_MAX_QUEUE", 1000))     # queries waiting beyond that before new ones are turned away
+
 css = """
 div {
     flex-wrap: nowrap !important;
@@ -247,4 +358,6 @@ with gr.Blocks(title="My AI Client", css=css, js=js, fill_height=True) as demo:
     submit_btn.click(fn=handle_query, inputs=[user_input, url_input], outputs=[chatbot])
     reset_btn.click(fn=reset_session, inputs=[], outputs=[user_input, chatbot])
 
+# Handlers only await the agents, so many can run at once without blocking each other
+demo.queue(default_concurrency_limit=CONCURRENCY, max_size=MAX_QUEUE)
 demo.launch(share=True, favicon_path="")
\ No newline at end of file
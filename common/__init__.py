@@ -0,0 +1 @@
+"""Modules shared by the agents and the client; agent entry points put the repository root on sys.path"""
@@ -0,0 +1,262 @@
+import asyncio, atexit, contextlib, inspect, json, logging, os, resource, shutil, tempfile, time
+from collections import defaultdict
+from typing import Callable
+
+# prometheus_client picks where metric values live when it is imported. They are kept in
+# per-process files here, so that forked workers add up to one set of series in every scrape.
+_OWN_DIR = None
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    _OWN_DIR = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="agent-metrics-")
+    _OWNER = os.getpid()
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from web3.middleware import Web3Middleware
+
+
+# Upper bounds in seconds, from a fast RPC call to a full LLM run
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
+# A2A JSON-RPC methods timed under their own name; others are counted as "other"
+RPC_METHODS = frozenset((
+    "message/send", "message/stream", "tasks/get", "tasks/cancel", "tasks/resubscribe",
+    "tasks/pushNotificationConfig/set", "tasks/pushNotificationConfig/get",
+    "tasks/pushNotificationConfig/list", "tasks/pushNotificationConfig/delete",
+))
+
+logger = logging.getLogger(__name__)
+
+# Shared by all agents; each instruments the parts it has
+REQUESTS = Histogram(
+    "a2a_request_seconds", "Requests served, by JSON-RPC method and HTTP status; streams count until they close",
+    ("method", "status"), buckets=BUCKETS,
+)
+EXECUTIONS = Gauge("agent_executions_in_flight", "Agent executor runs in progress", multiprocess_mode="livesum")
+OUTBOUND = Histogram(
+    "outbound_call_seconds", "Calls to the chain RPC node, arXiv, Gemini and peer agents",
+    ("target", "operation", "outcome"), buckets=BUCKETS,
+)
+LAG = Histogram("event_loop_lag_seconds", "How late the event loop ran a scheduled callback", buckets=BUCKETS)
+
+
+# ────────────────── registry ──────────────────
+class Metrics:
+    """
+    Metrics of one agent, served in the Prometheus text format
+
+    The histograms and gauges above are summed over all worker processes.
+    Besides them, a scrape reads the `stats()` of the components registered
+    with `collect()` and exports their numbers as gauges. Those, and the
+    process memory, come from whichever worker accepts the scrape; with
+    several workers they carry its `worker` label.
+    """
+
+    def __init__(self):
+        self._collectors: dict[str, Callable] = {}
+        self._lag_task: asyncio.Task | None = None
+
+    def collect(self, prefix: str, stats: Callable):
+        """Exports what `stats()` returns (a dict, or an awaitable of one) under `prefix`"""
+        self._collectors[prefix] = stats
+
+    def start(self):
+        self._lag_task = asyncio.create_task(self._probe_lag())
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+        # uvicorn re-raises SIGTERM once it has shut down, so a single-process agent never reaches atexit
+        _remove_own_dir()
+
+    def route(self, path: str = "/metrics") -> Route:
+        return Route(path, self._handle, methods=["GET"], name="metrics")
+
+    async def render(self) -> bytes:
+        worker = {"worker": os.getenv("AGENT_WORKER", "0")} if int(os.getenv("AGENT_WORKERS", 1)) > 1 else {}
+        families = [_gauge("process_resident_memory_bytes", "Resident memory of this process", [({}, _rss())], worker)]
+        for prefix, stats in self._collectors.items():
+            try:
+                values = stats()
+                if inspect.isawaitable(values):
+                    values = await values
+            except Exception as e:
+                logger.warning(f"Collecting {prefix} stats failed: {e}")
+                continue
+            for name, samples in _flatten(prefix, values).items():
+                families.append(_gauge(name, f"{prefix}.stats()", samples, worker))
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(_Snapshot(families))
+        return generate_latest(registry)
+
+    # Helper functions
+    async def _handle(self, request: Request) -> Response:
+        return Response(await self.render(), media_type=CONTENT_TYPE_LATEST)
+
+    async def _probe_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            LAG.observe(max(0.0, loop.time() - expected))
+
+
+METRICS = Metrics()
+
+
+def _remove_own_dir():
+    """Deletes the metric files directory, in the process that created it; workers keep writing to open files"""
+    if _OWN_DIR and os.getpid() == _OWNER:
+        shutil.rmtree(_OWN_DIR, ignore_errors=True)
+
+
+atexit.register(_remove_own_dir)
+
+
+class _Snapshot:
+    """Collector handing out metric families read before the scrape"""
+
+    def __init__(self, families: list[GaugeMetricFamily]):
+        self.families = families
+
+    def collect(self):
+        return self.families
+
+
+# ────────────────── outbound calls ──────────────────
+class RpcMetrics(Web3Middleware):
+    """Times every JSON-RPC call an AsyncWeb3 instance makes; add with `w3.middleware_onion.add(RpcMetrics)`"""
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            start, outcome = time.perf_counter(), "error"
+            try:
+                response = await make_request(method, params)
+                if "error" not in response:
+                    outcome = "ok"
+                return response
+            finally:
+                OUTBOUND.labels("rpc", method, outcome).observe(time.perf_counter() - start)
+        return middleware
+
+
+@contextlib.contextmanager
+def outbound_call(target: str, operation: str):
+    """Times the block as an outbound call, failed if it raises"""
+    start, outcome = time.perf_counter(), "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        OUTBOUND.labels(target, operation, outcome).observe(time.perf_counter() - start)
+
+
+def observe_peer(url: str, state: str, seconds: float):
+    """`on_send` hook for RemoteAgentPool"""
+    OUTBOUND.labels("peer", url, state).observe(seconds)
+
+
+# ────────────────── request middleware ──────────────────
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request under its JSON-RPC method, or its path otherwise"""
+
+    def __init__(self, app, rpc_path: str = "/"):
+        self.app = app
+        self.rpc_path = rpc_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["path"]
+        if scope["path"] == self.rpc_path and scope["method"] == "POST":
+            # The body is read up front to find the method, then handed to the app unchanged
+            body, more = b"", True
+            while more:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                body += message.get("body", b"")
+                more = message.get("more_body", False)
+            method = _rpc_method(body)
+            receive = _replay(body, receive)
+        elif scope["path"].startswith("/a2a/callback/"):
+            method = "push_callback"  # one series for all webhook tokens
+        status = 500
+        async def track(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, track)
+        finally:
+            REQUESTS.labels(method, status).observe(time.perf_counter() - start)
+
+
+# Helper functions
+def _replay(body: bytes, receive):
+    """ASGI receive that hands out an already read body first, then defers to `receive`"""
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    async def replay():
+        return pending.pop() if pending else await receive()
+    return replay
+
+
+def _rpc_method(body: bytes) -> str:
+    """The request's method if it is a known one, so clients can't create series at will"""
+    try:
+        method = json.loads(body).get("method")
+    except (ValueError, AttributeError):
+        return "invalid"
+    if not isinstance(method, str):
+        return "invalid"
+    return method if method in RPC_METHODS else "other"
+
+
+def _gauge(name: str, help: str, samples: list[tuple[dict, float]], worker: dict) -> GaugeMetricFamily:
+    labels = [*worker, *(samples[0][0] if samples else {})]
+    family = GaugeMetricFamily(name, help, labels=labels)
+    for sample_labels, value in samples:
+        family.add_metric([*worker.values(), *sample_labels.values()], float(value))
+    return family
+
+
+def _flatten(prefix: str, stats: dict) -> dict[str, list]:
+    """
+    Turns a stats() dict into samples: numbers become gauges named after their key,
+    a dict of numbers becomes one gauge labelled by `key`, and a dict of dicts
+    becomes a gauge per inner key, labelled by the outer key
+    """
+    families = defaultdict(list)
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for label, inner in value.items():
+                if isinstance(inner, dict):
+                    for name, number in inner.items():
+                        if _is_number(number):
+                            families[f"{prefix}_{name}"].append(({"key": str(label)}, number))
+                elif _is_number(inner):
+                    families[f"{prefix}_{key}"].append(({"key": str(label)}, inner))
+        elif _is_number(value):
+            families[f"{prefix}_{key}"].append(({}, value))
+    return families
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))  # bools included, as 0 and 1
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current usage where /proc is missing; macOS reports bytes, Linux KiB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
@@ -0,0 +1,96 @@
+import asyncio, logging
+from uuid import uuid4
+
+from a2a.server.context import ServerCallContext
+from a2a.server.events.event_queue import EventQueue
+from a2a.server.agent_execution import RequestContext
+from a2a.server.request_handlers import DefaultRequestHandler
+from a2a.server.tasks import PushNotifier, TaskStore
+from a2a.types import Message, MessageSendParams, Task, TaskState, TaskStatus
+
+
+# States after which a task receives no further notifications
+FINAL_STATES = (TaskState.completed, TaskState.failed, TaskState.canceled, TaskState.rejected)
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── task store ──────────────────
+class PushTaskStore(TaskStore):
+    """
+    Task store wrapper that pushes every saved task to its registered callback
+
+    The SDK only notifies while serving `message/stream`; saving is the one
+    place every task change passes through, whichever method created it.
+    """
+
+    def __init__(self, store: TaskStore, push_notifier: PushNotifier):
+        self.store = store
+        self.push_notifier = push_notifier
+
+    async def save(self, task: Task):
+        await self.store.save(task)
+        await self.push_notifier.send_notification(task)
+        if task.status.state in FINAL_STATES:
+            await self.push_notifier.delete_info(task.id)
+
+    async def get(self, task_id: str) -> Task | None:
+        return await self.store.get(task_id)
+
+    async def delete(self, task_id: str):
+        await self.store.delete(task_id)
+        await self.push_notifier.delete_info(task_id)
+
+
+# ────────────────── request handler ──────────────────
+class PushRequestHandler(DefaultRequestHandler):
+    """
+    DefaultRequestHandler that honours push-notification configs on every request
+
+    Registers the config sent along with a message, including the one that
+    creates the task, and answers non-blocking sends right away while the agent
+    keeps running in the background.
+    """
+
+    def __init__(self, agent_executor, task_store: TaskStore, push_notifier: PushNotifier, **kwargs):
+        super().__init__(
+            agent_executor=agent_executor,
+            task_store=PushTaskStore(task_store, push_notifier),
+            push_notifier=push_notifier,
+            **kwargs,
+        )
+        self._background: set[asyncio.Task] = set()
+
+    async def on_message_send(
+        self, params: MessageSendParams, context: ServerCallContext | None = None,
+    ) -> Message | Task:
+        config = params.configuration
+        if not (config and config.pushNotificationConfig and config.blocking is False):
+            return await super().on_message_send(params, context)
+
+        # Fix the ids up front so the caller can be answered before the agent runs
+        message = params.message
+        task = await self.task_store.get(message.taskId) if message.taskId else None
+        message.taskId = message.taskId or str(uuid4())
+        message.contextId = message.contextId or (task.contextId if task else str(uuid4()))
+
+        run = asyncio.create_task(super().on_message_send(params, context))
+        self._background.add(run)
+        run.add_done_callback(self._finished)
+        return Task(
+            id=message.taskId,
+            contextId=message.contextId,
+            status=TaskStatus(state=TaskState.submitted),
+            history=[message],
+        )
+
+    async def _run_event_stream(self, request: RequestContext, queue: EventQueue):
+        config = request.configuration
+        if config and config.pushNotificationConfig:
+            await self._push_notifier.set_info(request.task_id, config.pushNotificationConfig)
+        await super()._run_event_stream(request, queue)
+
+    def _finished(self, run: asyncio.Task):
+        self._background.discard(run)
+        if not run.cancelled() and run.exception():
+            logger.error(f"Background request failed: {run.exception()}")
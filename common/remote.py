@@ -0,0 +1,341 @@
+import asyncio, contextlib, httpx, importlib.util, logging, time
+from typing import Callable
+from uuid import uuid4
+from httpx_sse import SSEError
+from pydantic import ValidationError
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from a2a.client import A2ACardResolver, A2AClient, A2AClientError, A2AClientHTTPError
+from a2a.types import (
+    AgentCard, GetTaskRequest, Message, MessageSendConfiguration, MessageSendParams,
+    PushNotificationConfig, SendMessageRequest, SendStreamingMessageRequest, Task,
+    TaskQueryParams, TaskArtifactUpdateEvent, TaskState, TaskStatus, TaskStatusUpdateEvent,
+)
+from a2a.utils import append_artifact_to_task
+from opentelemetry import trace
+
+from common.tracing import inject
+
+
+PEER_MODES = ("stream", "push", "poll")
+POLL_DELAY = 3     # seconds
+PUSH_TIMEOUT = 30  # seconds without a webhook before checking the task directly
+
+# States in which the remote agent stops producing events for a request
+STOP_STATES = (
+    TaskState.input_required, TaskState.completed, TaskState.failed,
+    TaskState.canceled, TaskState.rejected,
+)
+
+UpdateEvent = TaskStatusUpdateEvent | TaskArtifactUpdateEvent
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+class RemoteAgentError(A2AClientError):
+    """Remote agent answered with a JSON-RPC error or an unexpected result"""
+
+
+# ────────────────── remote agent ──────────────────
+class RemoteAgent:
+    """
+    A2A peer reachable at `url`
+
+    Sends a message and follows the resulting task until it stops producing events.
+    In "push" mode the peer reports task changes to `receiver`; otherwise uses
+    `message/stream` when the peer advertises streaming and polls `tasks/get` as a fallback.
+    `on_send(url, state, seconds)` is called after every send, with state "error" if it raised.
+    """
+
+    def __init__(
+        self, httpx_client: httpx.AsyncClient, url: str, mode: str = "stream",
+        receiver: "PushReceiver | None" = None, on_send: Callable[[str, str, float], None] | None = None,
+    ):
+        self.url = url
+        self.mode = mode
+        self.receiver = receiver
+        self.on_send = on_send
+        self.client = A2AClient(httpx_client=httpx_client, url=url)
+        self._httpx_client = httpx_client
+        self._card: AgentCard | None = None
+
+    async def get_card(self) -> AgentCard | None:
+        if self._card is None:
+            try:
+                self._card = await A2ACardResolver(self._httpx_client, self.url).get_agent_card()
+            except A2AClientError as e:
+                logger.warning(f"Could not resolve agent card at {self.url}: {e}")
+        return self._card
+
+    async def supports_streaming(self) -> bool:
+        if self.mode == "poll":
+            return False
+        card = await self.get_card()
+        return bool(card and card.capabilities.streaming)
+
+    async def supports_push(self) -> bool:
+        if self.mode != "push" or self.receiver is None:
+            return False
+        card = await self.get_card()
+        return bool(card and card.capabilities.pushNotifications)
+
+    async def send(self, message: Message, on_update: Callable[[UpdateEvent], None] | None = None) -> Task:
+        """
+        Sends `message` and returns the task once it reaches one of STOP_STATES.
+        Status and artifact events are passed to `on_update` as soon as they arrive.
+        """
+        on_update = on_update or (lambda event: None)
+        # The trace context travels in the message metadata, so the peer's spans join this trace
+        message = message.model_copy(update={"metadata": inject(message.metadata)})
+        start, state = time.perf_counter(), "error"
+        with tracer.start_as_current_span("a2a.send", attributes={"a2a.peer": self.url}) as span:
+            def traced(event: UpdateEvent):
+                span.add_event("artifact" if isinstance(event, TaskArtifactUpdateEvent) else f"status.{event.status.state.value}")
+                on_update(event)
+            try:
+                task = await self._send(message, traced, span)
+                state = task.status.state.value
+            finally:
+                if self.on_send:
+                    self.on_send(self.url, state, time.perf_counter() - start)
+            span.set_attribute("a2a.task_state", state)
+            return task
+
+    # Helper functions
+    async def _send(self, message: Message, on_update: Callable[[UpdateEvent], None], span) -> Task:
+        if await self.supports_push():
+            span.set_attribute("a2a.mode", "push")
+            return await self._send_push(message, on_update)
+        if await self.supports_streaming():
+            span.set_attribute("a2a.mode", "stream")
+            try:
+                return await self._send_streaming(message, on_update)
+            except (A2AClientError, httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Sending again is only safe if the peer cannot have received the message
+                if not _undelivered(e):
+                    raise
+                logger.warning(f"Streaming to {self.url} failed, falling back to polling: {e}")
+        span.set_attribute("a2a.mode", "poll")
+        return await self._send_polling(message, on_update)
+
+    async def _send_streaming(self, message: Message, on_update: Callable[[UpdateEvent], None]) -> Task:
+        task = None
+        request = SendStreamingMessageRequest(
+            id=str(uuid4()),
+            params=MessageSendParams(message=message),
+        )
+        try:
+            async for resp in self.client.send_message_streaming(request):
+                if hasattr(resp.root, "error"):
+                    raise RemoteAgentError(resp.root.error.message)
+                event = resp.root.result
+                if isinstance(event, Task):
+                    task = event
+                    continue
+                if not isinstance(event, UpdateEvent):
+                    raise RemoteAgentError(f"Unexpected {event.kind} from {self.url}")
+                if task is None:
+                    task = Task(id=event.taskId, contextId=event.contextId,
+                                status=TaskStatus(state=TaskState.submitted))
+                if isinstance(event, TaskStatusUpdateEvent):
+                    task.status = event.status
+                else:
+                    append_artifact_to_task(task, event)
+                on_update(event)
+                if task.status.state in STOP_STATES or getattr(event, "final", False):
+                    break
+        except A2AClientError as e:
+            if task is None or isinstance(e, RemoteAgentError):
+                raise
+            # The peer is already running the task, so follow it rather than send the message again
+            logger.warning(f"Stream from {self.url} broke, polling task {task.id}: {e}")
+            return await self._poll(task, on_update, _snapshot(task))
+        if task is None:
+            raise RemoteAgentError(f"No task returned by {self.url}")
+        return task
+
+    async def _send_polling(self, message: Message, on_update: Callable[[UpdateEvent], None]) -> Task:
+        resp = await self.client.send_message(
+            SendMessageRequest(
+                id=str(uuid4()),
+                params=MessageSendParams(message=message),
+            )
+        )
+        return await self._poll(self._result(resp), on_update)
+
+    async def _poll(self, task: Task, on_update: Callable[[UpdateEvent], None], seen: dict | None = None) -> Task:
+        """Follows `task` with `tasks/get` until it stops; `seen` is what on_update has already been given"""
+        seen = seen or {"status": None, "artifacts": 0}
+        while True:
+            for event in _new_events(task, seen):
+                on_update(event)
+            if task.status.state in STOP_STATES:
+                return task
+            await asyncio.sleep(POLL_DELAY)
+            task = self._result(await self.client.get_task(
+                GetTaskRequest(
+                    id=str(uuid4()),
+                    params=TaskQueryParams(id=task.id),
+                )
+            ))
+
+    async def _send_push(self, message: Message, on_update: Callable[[UpdateEvent], None]) -> Task:
+        with self.receiver.subscribe() as (config, inbox):
+            resp = await self.client.send_message(
+                SendMessageRequest(
+                    id=str(uuid4()),
+                    params=MessageSendParams(
+                        message=message,
+                        configuration=MessageSendConfiguration(
+                            acceptedOutputModes=["text"],
+                            blocking=False,
+                            pushNotificationConfig=config,
+                        ),
+                    ),
+                )
+            )
+            task = self._result(resp)
+            seen = {"status": None, "artifacts": 0}
+            while True:
+                for event in _new_events(task, seen):
+                    on_update(event)
+                if task.status.state in STOP_STATES:
+                    return task
+                try:
+                    task = await asyncio.wait_for(inbox.get(), PUSH_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # A lost webhook must not strand the request
+                    task = self._result(await self.client.get_task(
+                        GetTaskRequest(
+                            id=str(uuid4()),
+                            params=TaskQueryParams(id=task.id),
+                        )
+                    ))
+
+    def _result(self, resp) -> Task:
+        if hasattr(resp.root, "error"):
+            raise RemoteAgentError(resp.root.error.message)
+        if not isinstance(resp.root.result, Task):
+            raise RemoteAgentError(f"No task returned by {self.url}")
+        return resp.root.result
+
+
+# ────────────────── client registry ──────────────────
+class RemoteAgentPool:
+    """
+    Long-lived HTTP clients keyed by remote agent URL
+
+    Connections are kept alive between requests (optionally multiplexed over HTTP/2)
+    and each agent card is resolved once. Close with `aclose()` on shutdown.
+    """
+
+    def __init__(
+        self, mode: str = "stream", timeout: float = 60, max_connections: int = 20,
+        max_keepalive: int = 10, keepalive_expiry: float = 30, http2: bool = False,
+        receiver: "PushReceiver | None" = None, on_send: Callable[[str, str, float], None] | None = None,
+    ):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+        self.mode = mode
+        self._timeout = timeout
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http2 = http2
+        self._receiver = receiver
+        self._on_send = on_send
+        self._agents: dict[str, RemoteAgent] = {}
+
+    def get(self, url: str) -> RemoteAgent:
+        key = url.rstrip("/")
+        agent = self._agents.get(key)
+        if agent is None:
+            httpx_client = httpx.AsyncClient(timeout=self._timeout, limits=self._limits, http2=self._http2)
+            agent = self._agents[key] = RemoteAgent(httpx_client, url, self.mode, self._receiver, self._on_send)
+        return agent
+
+    async def aclose(self):
+        agents, self._agents = self._agents, {}
+        await asyncio.gather(
+            *(agent.client.httpx_client.aclose() for agent in agents.values()),
+            return_exceptions=True,
+        )
+
+
+# ────────────────── push notifications ──────────────────
+class PushReceiver:
+    """
+    Webhook endpoint for task push notifications from remote agents
+
+    Every send subscribes under a fresh unguessable token that doubles as the
+    callback path, so a notification wakes exactly the coroutine waiting for it.
+    Mount `route()` on the agent's Starlette app.
+    """
+
+    def __init__(self, base_url: str, path: str = "/a2a/callback"):
+        self.base_url = base_url.rstrip("/")
+        self.path = path
+        self._inboxes: dict[str, asyncio.Queue] = {}
+
+    def route(self) -> Route:
+        return Route(f"{self.path}/{{token}}", self._handle, methods=["POST"], name="push_callback")
+
+    @contextlib.contextmanager
+    def subscribe(self):
+        token = uuid4().hex
+        inbox = self._inboxes[token] = asyncio.Queue()
+        try:
+            yield PushNotificationConfig(url=f"{self.base_url}{self.path}/{token}", token=token), inbox
+        finally:
+            self._inboxes.pop(token, None)
+
+    async def _handle(self, request: Request) -> Response:
+        inbox = self._inboxes.get(request.path_params["token"])
+        if inbox is None:
+            return Response(status_code=404)
+        try:
+            task = Task.model_validate(await request.json())
+        except (ValueError, ValidationError):
+            return Response(status_code=400)
+        inbox.put_nowait(task)
+        return Response(status_code=204)
+
+
+def _undelivered(error: Exception) -> bool:
+    """Whether a failed streaming request certainly never reached the peer's executor"""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    # An answer that is not an event stream is an HTTP error, returned before anything ran
+    return isinstance(error, A2AClientHTTPError) and isinstance(error.__cause__, SSEError)
+
+
+def _snapshot(task: Task) -> dict:
+    """What _new_events has to skip for a task whose events were already passed on"""
+    return {"status": _status_key(task), "artifacts": len(task.artifacts or [])}
+
+
+def _status_key(task: Task) -> tuple:
+    return task.status.state, task.status.message and task.status.message.messageId
+
+
+def _new_events(task: Task, seen: dict) -> list[UpdateEvent]:
+    """Turns the difference between two polled snapshots of a task into update events"""
+    events = []
+    artifacts = task.artifacts or []
+    for artifact in artifacts[seen["artifacts"]:]:
+        events.append(TaskArtifactUpdateEvent(taskId=task.id, contextId=task.contextId, artifact=artifact))
+    seen["artifacts"] = len(artifacts)
+    status_key = _status_key(task)
+    if status_key != seen["status"]:
+        events.append(TaskStatusUpdateEvent(
+            taskId=task.id, contextId=task.contextId, status=task.status,
+            final=task.status.state in STOP_STATES,
+        ))
+        seen["status"] = status_key
+    return events
@@ -0,0 +1,61 @@
+import logging, multiprocessing, os, signal, socket
+from typing import Callable
+
+import uvicorn
+
+
+logger = logging.getLogger(__name__)
+
+
+def worker_index() -> tuple[int, int]:
+    """(index, count) of the current worker process; (0, 1) when serving from a single process"""
+    return int(os.getenv("AGENT_WORKER", 0)), int(os.getenv("AGENT_WORKERS", 1))
+
+
+def serve(build_app: Callable, host: str, port: int, workers: int = 1):
+    """
+    Serves the app returned by `build_app()` from `workers` processes sharing one socket
+
+    Each worker is forked before the app is built, so clients, executors and
+    event loops are never shared between processes. Any state the workers
+    must agree on has to live in a shared backend such as a SQLite file.
+    """
+    if workers <= 1:
+        uvicorn.run(build_app(), host=host, port=port)
+        return
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_run_worker, args=(build_app, sock, host, port, i, workers))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Serving on http://{host}:{port} with {workers} workers")
+
+    def stop(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers got the same SIGINT and shut down on their own
+        for process in processes:
+            process.join()
+    finally:
+        sock.close()
+
+
+def _run_worker(build_app: Callable, sock: socket.socket, host: str, port: int, index: int, workers: int):
+    os.environ["AGENT_WORKER"], os.environ["AGENT_WORKERS"] = str(index), str(workers)
+    config = uvicorn.Config(build_app(), host=host, port=port)
+    uvicorn.Server(config).run(sockets=[sock])
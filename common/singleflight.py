@@ -0,0 +1,76 @@
+import asyncio, logging
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+
+T = TypeVar("T")
+Listener = Callable[[Any], None]
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── single flight ──────────────────
+class SingleFlight(Generic[T]):
+    """
+    Runs at most one call per key at a time; concurrent callers share its result
+
+    The first caller for a key starts `fn(emit)`; callers arriving while it runs
+    join it and get the same result, or the same exception. Anything the call
+    passes to `emit` reaches the `listener` of every caller that joined, so
+    joiners see progress from the moment they join. If the first caller is
+    cancelled, joiners get None and should run the call themselves. Nothing is
+    kept once the call returns, so results are never stale.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, tuple[asyncio.Future, list[Listener]]] = {}
+        self.calls = self.joined = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    async def run(
+        self, key: str, fn: Callable[[Listener], Awaitable[T]], listener: Listener | None = None,
+    ) -> tuple[T | None, bool]:
+        """Returns the result and whether it came from a call started by someone else"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            future, listeners = flight
+            if listener:
+                listeners.append(listener)
+            self.joined += 1
+            try:
+                # Shielded, so a joiner giving up doesn't cancel the call for everyone
+                return await asyncio.shield(future), True
+            finally:
+                if listener in listeners:
+                    listeners.remove(listener)
+
+        future = asyncio.get_running_loop().create_future()
+        listeners = []
+        self._flights[key] = (future, listeners)
+        self.calls += 1
+
+        def emit(event):
+            for attached in list(listeners):
+                try:
+                    attached(event)
+                except Exception as e:
+                    logger.error(f"Single-flight listener failed: {e}")
+
+        try:
+            result = await fn(emit)
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here in case nobody joined
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "calls": self.calls, "joined": self.joined}
@@ -0,0 +1,174 @@
+import asyncio, logging, os, sqlite3, threading, time
+from collections import OrderedDict
+
+from a2a.server.tasks import TaskStore
+from a2a.types import Task, TaskState
+
+
+# States after which a task no longer changes and only waits for eviction
+TERMINAL_STATES = (TaskState.completed, TaskState.failed, TaskState.canceled, TaskState.rejected)
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── task store ──────────────────
+class SqliteTaskStore(TaskStore):
+    """
+    Task store backed by SQLite, with a bounded in-memory LRU of hot tasks
+
+    Saves land in the LRU right away and are written to SQLite in batches,
+    every `flush_interval` seconds or once `flush_size` tasks are dirty.
+    Terminal tasks are deleted `ttl` seconds after their last update, so
+    neither memory nor the database grows with uptime. Tasks left in any other
+    state, such as an unpaid invoice waiting for input, are deleted after
+    `pending_ttl` seconds, which should be the longer. Pass ":memory:" as
+    `path` for a store that does not survive restarts.
+
+    With `shared`, several processes use the same file: reads skip the LRU
+    and go to SQLite, so changes made by other processes are seen once they
+    have been flushed.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = 24 * 3600, pending_ttl: float = 7 * 24 * 3600, hot_tasks: int = 1000,
+        flush_interval: float = 0.5, flush_size: int = 100, shared: bool = False,
+    ):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.hot_tasks = hot_tasks
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.shared = shared
+        self._hot: OrderedDict[str, tuple[Task, float]] = OrderedDict()  # task id -> (task, time saved)
+        self._dirty: dict[str, Task | None] = {}  # task id -> task to write, or None to delete
+        self._flush_needed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, terminal INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_expiry ON tasks (terminal, updated)")
+
+    async def save(self, task: Task):
+        self._remember(task)
+        self._dirty[task.id] = task
+        self._start()
+        if len(self._dirty) >= self.flush_size:
+            self._flush_needed.set()
+
+    async def get(self, task_id: str) -> Task | None:
+        if task_id in self._hot and not self.shared:
+            self._hot.move_to_end(task_id)
+            return self._hot[task_id][0]
+        if task_id in self._dirty:
+            return self._dirty[task_id]
+        row = await asyncio.to_thread(self._read, task_id)
+        if row is None:
+            return None
+        data, updated = row
+        task = Task.model_validate_json(data)
+        self._remember(task, updated)
+        return task
+
+    async def delete(self, task_id: str):
+        self._hot.pop(task_id, None)
+        self._dirty[task_id] = None
+        self._start()
+
+    def stats(self) -> dict:
+        """Counts of cached, unflushed and stored tasks, and of stored tasks per state as of the last flush"""
+        with self._lock:
+            stored, = self._db.execute("SELECT COUNT(*) FROM tasks").fetchone()
+            states = self._db.execute("SELECT json_extract(data, '$.status.state'), COUNT(*) FROM tasks GROUP BY 1").fetchall()
+        return {"hot": len(self._hot), "dirty": len(self._dirty), "stored": stored, "states": dict(states)}
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._flush()
+        with self._lock:
+            self._db.close()
+
+    # Helper functions
+    def _remember(self, task: Task, updated: float | None = None):
+        self._hot[task.id] = (task, updated or time.time())
+        self._hot.move_to_end(task.id)
+        while len(self._hot) > self.hot_tasks:
+            self._hot.popitem(last=False)
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_sweep = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self._flush()
+                if time.monotonic() - last_sweep > min(self.ttl, self.pending_ttl, 60):
+                    last_sweep = time.monotonic()
+                    await self._sweep()
+            except Exception as e:
+                logger.error(f"Task store write failed: {e}")
+
+    async def _flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        now = time.time()
+        rows = [
+            (task_id, task.model_dump_json(exclude_none=True), task.status.state in TERMINAL_STATES, now)
+            for task_id, task in batch.items() if task is not None
+        ]
+        deleted = [(task_id,) for task_id, task in batch.items() if task is None]
+        try:
+            await asyncio.to_thread(self._write, rows, deleted)
+        except Exception:
+            # Keep the batch unless newer changes superseded it
+            self._dirty = batch | self._dirty
+            raise
+
+    def _write(self, rows: list[tuple], deleted: list[tuple]):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO tasks (id, data, terminal, updated) VALUES (?, ?, ?, ?)", rows)
+                self._db.executemany("DELETE FROM tasks WHERE id = ?", deleted)
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _read(self, task_id: str) -> tuple[str, float] | None:
+        with self._lock:
+            return self._db.execute("SELECT data, updated FROM tasks WHERE id = ?", (task_id,)).fetchone()
+
+    async def _sweep(self):
+        now = time.time()
+        cutoff, pending_cutoff = now - self.ttl, now - self.pending_ttl
+        count = await asyncio.to_thread(self._delete_expired, cutoff, pending_cutoff)
+        # Hot copies of expired tasks go too, so they aren't served after their row is gone
+        for task_id, (task, updated) in list(self._hot.items()):
+            if updated < (cutoff if task.status.state in TERMINAL_STATES else pending_cutoff):
+                del self._hot[task_id]
+        if count:
+            logger.debug(f"Evicted {count} expired tasks from {self.path}")
+
+    def _delete_expired(self, cutoff: float, pending_cutoff: float) -> int:
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM tasks WHERE (terminal = 1 AND updated < ?) OR (terminal = 0 AND updated < ?)",
+                (cutoff, pending_cutoff),
+            ).rowcount
@@ -0,0 +1,130 @@
+import click, json, logging, os, threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Sequence
+
+from opentelemetry import propagate, trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+
+# The A2A SDK records a span for every event-queue call, which would bury a request's own phases
+QUIET_SCOPES = {"a2a-python-sdk"}
+
+logger = logging.getLogger(__name__)
+
+
+def setup_tracing(service: str, path: str | None = None, otlp_endpoint: str | None = None) -> TracerProvider | None:
+    """
+    Exports this process's spans to a JSONL file at `path` and/or an OTLP/HTTP collector
+
+    Tracing stays a no-op when neither is given. When serving from several
+    workers, each writes to its own file (`name.<worker>.jsonl`).
+    Call `shutdown()` on the returned provider to flush pending spans.
+    """
+    if not path and not otlp_endpoint:
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    if path:
+        if int(os.getenv("AGENT_WORKERS", 1)) > 1:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{os.getenv('AGENT_WORKER', 0)}{ext}"
+        provider.add_span_processor(_QuietProcessor(JsonlSpanExporter(path)))
+    if otlp_endpoint:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise RuntimeError("Exporting to a collector requires `pip install opentelemetry-exporter-otlp-proto-http`")
+        provider.add_span_processor(_QuietProcessor(OTLPSpanExporter(endpoint=otlp_endpoint)))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def extract(metadata: dict | None) -> Context:
+    """Trace context a peer sent along in A2A message metadata"""
+    return propagate.extract(metadata or {})
+
+
+def inject(metadata: dict | None = None) -> dict:
+    """Copy of `metadata` carrying the current trace context"""
+    carrier = dict(metadata or {})
+    propagate.inject(carrier)
+    return carrier
+
+
+# ────────────────── file exporter ──────────────────
+class JsonlSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        with self._lock:
+            for span in spans:
+                self._file.write(span.to_json(indent=None) + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+class _QuietProcessor(BatchSpanProcessor):
+    """Batches spans for export, leaving out those of QUIET_SCOPES"""
+
+    def on_end(self, span: ReadableSpan):
+        if span.instrumentation_scope is None or span.instrumentation_scope.name not in QUIET_SCOPES:
+            super().on_end(span)
+
+
+# ────────────────── timeline CLI ──────────────────
+@click.command()
+@click.argument('paths', nargs=-1, required=True)  # span files of every agent, e.g. .cache/traces/*.jsonl
+@click.option('--trace-id', 'trace_id', default=None)  # defaults to the most recent trace
+def main(paths, trace_id):
+    """Rebuilds the timeline of one request from the span files written by the agents and client"""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    span = json.loads(line)
+                    traces[span["context"]["trace_id"].removeprefix("0x")].append(span)
+    if not traces:
+        raise click.ClickException("No spans found")
+    trace_id = (trace_id or max(traces, key=lambda t: max(s["end_time"] for s in traces[t]))).removeprefix("0x")
+    spans = traces.get(trace_id)
+    if not spans:
+        raise click.ClickException(f"Trace {trace_id} not found")
+
+    start = min(_time(span["start_time"]) for span in spans)
+    children = defaultdict(list)
+    ids = {span["context"]["span_id"] for span in spans}
+    for span in sorted(spans, key=lambda s: s["start_time"]):
+        parent = span["parent_id"] if span["parent_id"] in ids else None
+        children[parent].append(span)
+
+    click.echo(f"Trace {trace_id}")
+    click.echo(f"{'start':>9} {'duration':>9}  span")
+    def show(parent, depth):
+        for span in children[parent]:
+            offset = _time(span["start_time"]) - start
+            duration = _time(span["end_time"]) - _time(span["start_time"])
+            service = span["resource"]["attributes"].get("service.name", "?")
+            click.echo(f"{offset * 1000:8.0f}ms {duration * 1000:7.0f}ms  {'  ' * depth}{span['name']} [{service}]")
+            show(span["context"]["span_id"], depth + 1)
+    show(None, 0)
+
+
+def _time(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+if __name__ == '__main__':
+    main()
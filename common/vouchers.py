@@ -0,0 +1,43 @@
+from eth_account import Account
+from eth_account.messages import SignableMessage, encode_typed_data
+from hexbytes import HexBytes
+from web3 import Web3
+
+
+# Must match the EIP-712 domain and Voucher struct of BillingContract.sol;
+# signed by the user agent and recovered by the billing agent
+VOUCHER_TYPES = {
+    "Voucher": [
+        {"name": "payer", "type": "address"},
+        {"name": "contentId", "type": "bytes32"},
+        {"name": "amount", "type": "uint256"},
+    ],
+}
+
+
+def voucher_domain(chain_id: int, contract_address: str) -> dict:
+    return {
+        "name": "PaymentContract",
+        "version": "1",
+        "chainId": chain_id,
+        "verifyingContract": Web3.to_checksum_address(contract_address),
+    }
+
+
+def voucher_message(chain_id: int, contract_address: str, payer: str, content_id: str, amount: int) -> SignableMessage:
+    return encode_typed_data(
+        voucher_domain(chain_id, contract_address),
+        VOUCHER_TYPES,
+        {"payer": payer, "contentId": Web3.keccak(text=content_id), "amount": amount},
+    )
+
+
+def sign_voucher(account, chain_id: int, contract_address: str, content_id: str, amount: int) -> str:
+    """Signs a voucher spending `amount` of the account's deposit on `content_id` and returns the hex signature"""
+    signable = voucher_message(chain_id, contract_address, account.address, content_id, amount)
+    return "0x" + bytes(account.sign_message(signable).signature).hex()
+
+
+def recover_voucher_signer(chain_id: int, contract_address: str, payer: str, content_id: str, amount: int, signature: str) -> str:
+    signable = voucher_message(chain_id, contract_address, payer, content_id, amount)
+    return Account.recover_message(signable, signature=HexBytes(signature))
@@ -1,12 +1,31 @@
+import asyncio
 import click
+import contextlib
+import httpx
 import logging
-import uvicorn
+import os
+import sys
+
+# common/ lives at the repository root, next to this agent's directory
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from a2a.server.apps import A2AStarletteApplication
-from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
+from a2a.server.tasks import InMemoryPushNotifier
 from a2a.types import AgentCapabilities, AgentCard, AgentSkill
-from agent_executor import ResearchAgentExecutor
+from google.adk.sessions import DatabaseSessionService
+from starlette.middleware import Middleware
+
+from common.metrics import METRICS, MetricsMiddleware
+from common.push import PushRequestHandler
+from common.serving import serve
+from common.task_store import SqliteTaskStore
+from common.tracing import setup_tracing
+
+from admission import AdmissionQueue
+from agent_executor import ResearchAgentExecutor, use_search_backend, use_search_cache
+from cache import SqliteCache
+from search import SEARCH_BACKENDS, ArxivApiBackend, LocalIndexBackend
+from sessions import BoundedSessionService
 
 
 logging.basicConfig()
@@ -14,8 +33,49 @@ logging.basicConfig()
 @click.command()
 @click.option('--host', default='localhost')  # example
 @click.option('--port', default=10002)        # example
+@click.option(                                # arXiv API or local metadata index
+    '--search-backend', 'search_backend', type=click.Choice(SEARCH_BACKENDS), default='api'
+)
+@click.option(                                # built with `python3 research_agent/search.py DUMP`
+    '--search-index', 'search_index', default='.cache/arxiv_index.sqlite'
+)
+@click.option(                                # arXiv search cache, survives restarts
+    '--search-cache', 'search_cache', default='.cache/arxiv_search.sqlite'
+)
+@click.option('--search-cache-ttl', 'search_cache_ttl', default=24 * 3600)  # seconds, 0 disables the cache
+@click.option('--search-cache-size', 'search_cache_size', default=10_000)   # max cached searches
+@click.option(                                # finished reports, ":memory:" or a SQLite file
+    '--report-cache', 'report_cache', default=':memory:'
+)
+@click.option('--report-cache-ttl', 'report_cache_ttl', default=0)          # seconds a report stays fresh, 0 disables
+@click.option('--report-cache-bytes', 'report_cache_bytes', default=64 * 2**20)
+@click.option(                                # task history, ":memory:" or a SQLite file
+    '--task-store', 'task_store_path', default='.cache/research_tasks.sqlite'
+)
+@click.option('--task-ttl', 'task_ttl', default=24 * 3600)  # seconds finished tasks are kept
+@click.option('--pending-task-ttl', 'pending_task_ttl', default=7 * 24 * 3600)  # seconds unfinished tasks are kept
+@click.option('--session-ttl', 'session_ttl', default=3600)          # seconds an idle LLM session is kept
+@click.option('--max-sessions', 'max_sessions', default=1000)        # LLM sessions kept, least recently used go first
+@click.option('--session-bytes', 'session_bytes', default=256 * 2**20)  # max bytes of session events, 0 = no limit
+@click.option('--stateless/--no-stateless', default=False)          # drop each session when its request is done
+@click.option(                                # LLM sessions, ":memory:" or a SQLite file shared by all workers
+    '--session-store', 'session_store', default=':memory:'
+)
+@click.option('--workers', default=1)         # server processes, sharing the task and session stores
+@click.option('--concurrency', default=4)     # LLM runs at a time, per worker
+@click.option('--max-queue', 'max_queue', default=100)  # jobs waiting for a run before new ones are rejected
+@click.option('--trace-file', 'trace_file', default=None)  # spans as JSONL, e.g. .cache/traces/research.jsonl
+@click.option('--trace-otlp', 'trace_otlp', default=None)  # OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces
 
-def main(host, port):
+def main(
+    host, port, search_backend, search_index, search_cache, search_cache_ttl, search_cache_size,
+    report_cache, report_cache_ttl, report_cache_bytes, task_store_path, task_ttl, pending_task_ttl,
+    session_ttl, max_sessions, session_bytes, stateless, session_store, workers, concurrency, max_queue,
+    trace_file, trace_otlp,
+):
+    if workers > 1 and ':memory:' in (task_store_path, session_store):
+        # A follow-up may reach a different worker than the one holding the conversation
+        raise click.UsageError("--workers needs --task-store and --session-store files the workers can share")
     # 1. 스킬 메타데이터 설정
     skill = AgentSkill(
         id="analyze_research",
@@ -33,19 +93,57 @@ def main(host, port):
         version="1.0.0",
         defaultInputModes=['text'],
         defaultOutputModes=['text'],
-        capabilities=AgentCapabilities(streaming=True),
+        capabilities=AgentCapabilities(streaming=True, pushNotifications=True),
         skills=[skill]
     )
     # 3. 에이전트 서버 실행
-    request_handler = DefaultRequestHandler(
-        agent_executor=ResearchAgentExecutor(agent_card),
-        task_store=InMemoryTaskStore(),
-    )
-    server = A2AStarletteApplication(
-        agent_card=agent_card,
-        http_handler=request_handler
-    )
-    uvicorn.run(server.build(), host=host, port=port)
+    # Each worker process builds its own app; state they share lives in SQLite files
+    def build_app():
+        # ADK records its own spans for agent runs, LLM calls and tool calls under the same provider
+        tracer_provider = setup_tracing("research-agent", trace_file, trace_otlp)
+        use_search_backend(LocalIndexBackend(search_index) if search_backend == 'local' else ArxivApiBackend())
+        searches = SqliteCache(search_cache, ttl=search_cache_ttl, max_entries=search_cache_size) if search_cache_ttl > 0 else None
+        use_search_cache(searches)
+        reports = SqliteCache(report_cache, ttl=report_cache_ttl, max_bytes=report_cache_bytes) if report_cache_ttl > 0 else None
+        if session_store == ':memory:':
+            sessions = BoundedSessionService(session_ttl, max_sessions, session_bytes or None)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(session_store)), exist_ok=True)
+            sessions = DatabaseSessionService(f"sqlite:///{session_store}")
+        push_client = httpx.AsyncClient(timeout=10)
+        task_store = SqliteTaskStore(task_store_path, ttl=task_ttl, pending_ttl=pending_task_ttl, shared=workers > 1)
+        agent_executor = ResearchAgentExecutor(
+            agent_card, reports, sessions, stateless, AdmissionQueue(concurrency, max_queue),
+        )
+        METRICS.collect("task_store", lambda: asyncio.to_thread(task_store.stats))
+        METRICS.collect("admission", agent_executor.admission.stats)
+        METRICS.collect("research_runs", agent_executor.flights.stats)
+        for name, component in (("sessions", sessions), ("search_cache", searches), ("report_cache", reports)):
+            if hasattr(component, "stats"):
+                METRICS.collect(name, component.stats)
+        request_handler = PushRequestHandler(
+            agent_executor=agent_executor,
+            task_store=task_store,
+            push_notifier=InMemoryPushNotifier(push_client),
+        )
+        server = A2AStarletteApplication(
+            agent_card=agent_card,
+            http_handler=request_handler
+        )
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            METRICS.start()
+            yield
+            await METRICS.stop()
+            await task_store.close()
+            await push_client.aclose()
+            for c in (searches, reports):
+                if c:
+                    c.close()
+            if tracer_provider:
+                tracer_provider.shutdown()
+        return server.build(routes=[METRICS.route()], middleware=[Middleware(MetricsMiddleware)], lifespan=lifespan)
+    serve(build_app, host, port, workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,126 @@
+import asyncio, bisect, contextlib, heapq, itertools, logging, time
+from typing import Callable
+
+
+# Lower runs first: paid requests from the billing agent, then direct
+# requests, then speculative research for invoices that may never be paid
+PRIORITIES = {"paid": 0, "default": 1, "speculative": 2}
+CONCURRENCY = 4    # LLM runs at a time
+MAX_QUEUE = 100    # jobs waiting for a run before new ones are rejected
+WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # seconds, upper bounds of the wait histogram
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a job cannot be admitted because the queue is full"""
+
+
+# ────────────────── admission queue ──────────────────
+class AdmissionQueue:
+    """
+    Bounded worker pool with a priority queue in front of it
+
+    At most `concurrency` jobs hold a slot at once; the rest wait in order of
+    priority, then arrival. Once `max_queue` jobs are waiting, a new job is
+    rejected with QueueFull right away, unless it outranks the last queued job,
+    which is rejected in its place. Waiting jobs are told their position in the
+    queue whenever it changes.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENCY, max_queue: int = MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.admitted = self.rejected = 0
+        self.wait_total = 0.0  # seconds admitted jobs spent queued
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)  # last bucket counts waits beyond the largest bound
+        self._waiting: list[tuple[int, int, "_Waiter"]] = []  # heap of (priority, arrival, waiter)
+        self._arrivals = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITIES["default"], on_position: Callable[[int], None] | None = None):
+        """Waits for a free slot and holds it for the body of the `async with`"""
+        await self._acquire(priority, on_position)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self._waiting),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_total": self.wait_total,
+            "wait_buckets": dict(zip((*WAIT_BUCKETS, float("inf")), itertools.accumulate(self.wait_buckets))),
+        }
+
+    # Helper functions
+    async def _acquire(self, priority: int, on_position: Callable[[int], None] | None):
+        start = time.monotonic()
+        if self.running < self.concurrency and not self._waiting:
+            self.running += 1
+            self._record(0.0)
+            return
+
+        if len(self._waiting) >= self.max_queue:
+            worst = max(self._waiting)
+            if worst[0] <= priority:
+                self.rejected += 1
+                raise QueueFull(f"{len(self._waiting)} jobs already waiting")
+            self._waiting.remove(worst)
+            heapq.heapify(self._waiting)
+            self.rejected += 1
+            worst[2].future.set_exception(QueueFull("Displaced by a higher-priority job"))
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        heapq.heappush(self._waiting, (priority, next(self._arrivals), waiter))
+        self._notify()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Admitted just as the caller gave up; hand the slot on
+                self._release()
+            else:
+                self._waiting = [entry for entry in self._waiting if entry[2] is not waiter]
+                heapq.heapify(self._waiting)
+                self._notify()
+            raise
+        self._record(time.monotonic() - start)
+
+    def _release(self):
+        # A freed slot passes straight to the next waiter
+        self.running -= 1
+        while self._waiting and self.running < self.concurrency:
+            _, _, waiter = heapq.heappop(self._waiting)
+            if not waiter.future.done():
+                self.running += 1
+                waiter.future.set_result(None)
+        self._notify()
+
+    def _notify(self):
+        for position, (_, _, waiter) in enumerate(sorted(self._waiting), 1):
+            if waiter.position != position:
+                waiter.position = position
+                if waiter.on_position:
+                    try:
+                        waiter.on_position(position)
+                    except Exception as e:
+                        logger.error(f"Queue position callback failed: {e}")
+
+    def _record(self, wait: float):
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS, wait)] += 1
+        if wait:
+            logger.debug(f"Admitted after {wait:.2f}s in queue ({len(self._waiting)} still waiting)")
+
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, on_position: Callable[[int], None] | None):
+        self.future = future
+        self.on_position = on_position
+        self.position = 0
@@ -1,5 +1,4 @@
-import utils
-import arxiv, logging, os
+import asyncio, itertools, logging, os
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -7,17 +6,30 @@ from google.adk.agents.llm_agent import LlmAgent
 from google.adk.artifacts import InMemoryArtifactService
 from google.adk.events import Event
 from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
+from google.adk.models import BaseLlm, LLMRegistry
+from google.adk.models.llm_request import LlmRequest
+from google.adk.sessions import BaseSessionService
 from google.adk.runners import Runner, RunConfig
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events.event_queue import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
-    AgentCard, TaskState, UnsupportedOperationError,
+    AgentCard, Part, TaskState, TextPart, UnsupportedOperationError,
 )
 from a2a.utils.errors import ServerError
+from opentelemetry import trace
+
+from common.metrics import EXECUTIONS, outbound_call
+from common.singleflight import SingleFlight
+from common.tracing import extract
+
+import utils
+from admission import PRIORITIES, AdmissionQueue, QueueFull
+from cache import SqliteCache, normalize_query
+from search import ArxivApiBackend, LocalIndexBackend
+from sessions import BoundedSessionService
 
 # import utils  # A2A<->GenAI conversion helpers
 
@@ -26,54 +38,108 @@ from a2a.utils.errors import ServerError
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
+# Shared with the billing agent; when set, only requests carrying it may claim paid priority
+PRIORITY_TOKEN = os.getenv("PRIORITY_TOKEN")
 
+MODEL = os.getenv("RESEARCH_MODEL", "gemini-2.5-flash-preview-05-20")
 MAX_RESULTS = 10
+MAX_QUERIES = 5
+SEARCH_BACKEND = ArxivApiBackend()          # set with use_search_backend()
+SEARCH_CACHE: SqliteCache | None = None     # set with use_search_cache()
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+tracer = trace.get_tracer(__name__)
 
 
 # ────────────────── arXiv search tool ──────────────────
-def search_papers(query: str, max_results: int) -> list:
+async def search_papers(queries: list[str], max_results: int, categories: list[str], since: str) -> list:
     """
-    max_results should be 1-10. If caller passes >10 we clamp internally.
+    Searches arXiv for each query concurrently and returns the merged, de-duplicated papers.
+    Pass 1-5 queries. max_results should be 1-10. If caller passes >10 we clamp internally.
+    categories restricts results to arXiv categories such as "cs.CL" (pass [] for all).
+    since is the earliest publication date as YYYY-MM-DD (pass "" for no limit).
     """
-    if not query.strip():
+    queries = [query for query in queries if query.strip()][:MAX_QUERIES]
+    if not queries:
         raise ValueError("Query must be non-empty")
-    
-    logger.debug(f"Searching arXiv with query: \"{query}\"...")
+
     max_results = min(max_results, MAX_RESULTS)
-    search = arxiv.Search(
-        query = query.strip(),
-        max_results = max_results,
-        sort_by = arxiv.SortCriterion.Relevance
+    # Retrieval blocks on I/O, so it runs in worker threads off the event loop
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_search, query, max_results, categories, since) for query in queries)
     )
-    papers = []
-    for result in search.results():
-        papers.append({
-            "title": result.title,
-            "summary": result.summary,
-            "authors": [author.name for author in result.authors],
-            "categories": result.categories,
-            "published": result.published.strftime('%Y-%m-%d'),
-            "url": result.entry_id, 
-        })
-    logger.debug(f"Retrieved {len(papers)} papers:")
+    # Interleave so every query contributes to the top results
+    papers, seen = [], set()
+    for paper in itertools.chain.from_iterable(itertools.zip_longest(*results)):
+        if paper and paper["url"] not in seen:
+            seen.add(paper["url"])
+            papers.append(paper)
+    papers = papers[:max_results]
+    logger.debug(f"Merged {len(papers)} papers for {len(queries)} queries:")
     for i, paper in enumerate(papers):
         logger.debug(f"{i+1:02} {paper['title']}")
     return papers
 
 
+def _search(query: str, max_results: int, categories: list[str], since: str) -> list:
+    with tracer.start_as_current_span("research.arxiv_search", attributes={"query": query}) as span:
+        cache = SEARCH_CACHE if SEARCH_BACKEND.cacheable else None
+        cache_key = f"{max_results}:{','.join(sorted(categories))}:{since}:{normalize_query(query)}"
+        if cache is not None:
+            papers = cache.get(cache_key)
+            if papers is not None:
+                logger.debug(f"Found {len(papers)} cached papers for query: \"{query}\"")
+                span.set_attribute("cached", True)
+                return papers
+
+        logger.debug(f"Searching {SEARCH_BACKEND.name} backend with query: \"{query}\"...")
+        with outbound_call("arxiv", SEARCH_BACKEND.name):
+            papers = SEARCH_BACKEND.search(query, max_results, categories, since)
+        logger.debug(f"Retrieved {len(papers)} papers for query: \"{query}\"")
+        span.set_attributes({"cached": False, "backend": SEARCH_BACKEND.name, "papers": len(papers)})
+        if cache is not None:
+            cache.set(cache_key, papers)
+        return papers
+
+
+def use_search_backend(backend: ArxivApiBackend | LocalIndexBackend):
+    """Answers search_papers from `backend`"""
+    global SEARCH_BACKEND
+    SEARCH_BACKEND = backend
+
+
+def use_search_cache(cache: SqliteCache | None):
+    """Caches search_papers results in `cache` (None disables caching)"""
+    global SEARCH_CACHE
+    SEARCH_CACHE = cache
+
+
 # ────────────────── build LLM agent ──────────────────
+class TimedLlm(BaseLlm):
+    """Wraps the model the agent runs on, timing each call"""
+
+    llm: BaseLlm
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        with outbound_call("gemini", self.model):
+            async for response in self.llm.generate_content_async(llm_request, stream):
+                yield response
+
+    def connect(self, llm_request: LlmRequest):
+        return self.llm.connect(llm_request)
+
+
 def build_llm_agent() -> LlmAgent:
     prompt = """
 You are a research-trend analyst AI specialized in tracking cutting-edge topics in machine learning, AI, NLP, and related fields.
 
 🔍 Task Instructions:
-Step 1: Generate a concise and effective search term based on the user’s query.
-This term should reflect the core topic or method they’re interested in and will be used with the search_papers tool to fetch relevant arXiv papers.
+Step 1: Generate one to three concise and effective search terms based on the user’s query.
+These terms should reflect the core topic or method they’re interested in (and, if useful, closely related phrasings) and will be used with the search_papers tool to fetch relevant arXiv papers.
 
-Step 2: Use the search_papers tool with the generated term to retrieve up to 10 recent (within the past year), high-relevance papers from arXiv.
+Step 2: Call the search_papers tool once with all generated terms to retrieve up to 10 recent (within the past year), high-relevance papers from arXiv.
+Set since to the date one year before today, and only pass categories when the user's query clearly targets specific arXiv categories.
 
 Step 3: For each paper:
 • Include the title, author(s), and publication date.
@@ -86,7 +152,7 @@ Step 4: After listing the papers, write a ## Recent Trend Analysis section that:
 • Avoids jargon and maintains clarity for a broad research-oriented audience.
 
 📄 **Output Format (Markdown)**
-**Search Term:** *<automatically inferred search term from user query>*
+**Search Term:** *<automatically inferred search terms from user query>*
 
 ## Recent Papers
 1. **<Title>** (<Authors>, YYYY-MM-DD)  
@@ -106,7 +172,7 @@ Emphasize novelty, practicality, or conceptual contributions.
 Avoid copying text from abstracts verbatim.
 """
     return LlmAgent(
-        model='gemini-2.5-flash-preview-05-20',
+        model=TimedLlm(model=MODEL, llm=LLMRegistry.new_llm(MODEL)),
         name='research_agent',
         description=(
             "Analyzes arXiv papers and produces Korean trend summaries"
@@ -125,58 +191,181 @@ class ResearchAgentExecutor(AgentExecutor):
     """
 
     # Initialization
-    def __init__(self, agent_card: AgentCard):
+    def __init__(
+        self, agent_card: AgentCard, report_cache: SqliteCache | None = None,
+        session_service: BaseSessionService | None = None, stateless: bool = False,
+        admission: AdmissionQueue | None = None,
+    ):
         self.card = agent_card
+        self.report_cache = report_cache
+        self.admission = admission or AdmissionQueue()
+        self.flights: SingleFlight[list[Part] | None] = SingleFlight()
+        self.stateless = stateless  # drop each session once its request is answered
         self.runner = Runner(
             app_name=agent_card.name,
             agent=build_llm_agent(),
             artifact_service=InMemoryArtifactService(),
-            session_service=InMemorySessionService(),
+            session_service=session_service or BoundedSessionService(),
             memory_service=InMemoryMemoryService(),
         )
     
     # Core pipeline
     async def execute(self, context: RequestContext, event_queue: EventQueue):
+        # Continues the trace the billing agent started, if it sent one along
+        with tracer.start_as_current_span("research.execute", context=extract(context.message.metadata)), EXECUTIONS.track_inprogress():
+            await self._execute(context, event_queue)
+
+    async def _execute(self, context: RequestContext, event_queue: EventQueue):
         updater = TaskUpdater(event_queue, context.task_id, context.context_id)
         if not context.current_task:
             updater.submit()
         updater.start_work()
-        
+
+        # Repeat queries are answered from the report cache without running the LLM.
+        # The cache is keyed by the query alone, so only first turns may use it: a follow-up
+        # depends on its conversation and must neither be served nor stored under that key
+        cache_key = normalize_query(context.get_user_input())
+        first_turn = not await self._has_session(context)
         user_query = types.UserContent(
             parts=utils.convert_a2a_parts_to_genai(context.message.parts)
             # parts=context.message.parts
         )
-        logger.debug("Processing request...")
-        await self._process_request(user_query, context, updater)
+        if self.report_cache is not None and first_turn:
+            cached = self.report_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Serving cached report")
+                trace.get_current_span().set_attribute("report_cache_hit", True)
+                parts = [Part.model_validate(part) for part in cached]
+                await self._remember(context, user_query, parts)
+                updater.add_artifact(parts)
+                updater.complete()
+                return
+        
+        # Identical first-turn queries share one LLM run while it is in flight;
+        # a conversation with history of its own always gets its own run
+        priority = self._priority(context)
+        if not first_turn:
+            parts = await self._run(user_query, context, updater, priority)
+        else:
+            flight_key = f"{priority}:{cache_key}"
+            if flight_key in self.flights:
+                logger.debug("Joining identical request in flight")
+            parts, joined = await self.flights.run(
+                flight_key,
+                lambda emit: self._run(user_query, context, updater, priority, emit),
+                lambda update: self._working(updater, *update),
+            )
+            trace.get_current_span().set_attribute("joined", joined)
+            if joined:
+                if parts:
+                    updater.add_artifact(parts)
+                    updater.complete()
+                    return
+                # The shared run was cancelled or rejected, so try on our own
+                parts = await self._run(user_query, context, updater, priority)
+        if parts and self.report_cache is not None and first_turn:
+            self.report_cache.set(cache_key, [part.model_dump(mode="json", exclude_none=True) for part in parts])
         logger.debug("Task completed")
     
-    async def _process_request(self, user_query: types.UserContent, context: RequestContext, updater: TaskUpdater):
+    async def _run(
+        self, user_query: types.UserContent, context: RequestContext, updater: TaskUpdater,
+        priority: int, emit=None,
+    ) -> list[Part] | None:
+        """Admits the LLM run through a bounded queue, paid requests first; None if it was rejected"""
+        def on_position(position: int):
+            # Tagged so callers can tell a queued request from one being worked on
+            self._working(
+                updater, [Part(TextPart(text=f"Queued for analysis (position {position})"))], emit,
+                {"queue_position": position},
+            )
+        try:
+            # Time spent queued shows up as the gap before the "admitted" event
+            with tracer.start_as_current_span("research.run", attributes={"priority": priority}) as span:
+                async with self.admission.slot(priority, on_position):
+                    span.add_event("admitted")
+                    logger.debug("Processing request...")
+                    return await self._process_request(user_query, context, updater, emit)
+        except QueueFull as e:
+            logger.warning(f"Rejected request: {e}")
+            updater.update_status(
+                TaskState.rejected,
+                message=updater.new_agent_message([Part(TextPart(text="Research queue is full, try again later"))]),
+                final=True,
+            )
+            return None
+
+    async def _process_request(
+        self, user_query: types.UserContent, context: RequestContext, updater: TaskUpdater, emit=None,
+    ):
+        """Runs the LLM agent and returns the parts of the final report"""
         session = await self._get_session(context)
-        async for event in self.runner.run_async(
-            session_id=session.id, 
-            user_id=session.user_id, 
-            new_message=user_query, 
-            run_config=RunConfig(), 
-        ):
-            await self._handle_event(event, updater)
+        report = None
+        try:
+            async for event in self.runner.run_async(
+                session_id=session.id, 
+                user_id=session.user_id, 
+                new_message=user_query, 
+                run_config=RunConfig(), 
+            ):
+                # ADK traces the LLM calls and tool calls themselves; this marks when each event reached us
+                trace.get_current_span().add_event("adk.event", {
+                    "author": event.author,
+                    "function_calls": [call.name for call in event.get_function_calls()],
+                    "final": event.is_final_response(),
+                })
+                report = await self._handle_event(event, updater, emit) or report
+        finally:
+            # Also when the run fails or is cancelled, or failed runs would keep their sessions
+            if self.stateless:
+                await self.runner.session_service.delete_session(
+                    app_name=self.runner.app_name, user_id=session.user_id, session_id=session.id,
+                )
+        return report
     
-    async def _handle_event(self, event: Event, updater: TaskUpdater):
+    async def _handle_event(self, event: Event, updater: TaskUpdater, emit=None):
         if event.is_final_response():
             parts = utils.convert_genai_parts_to_a2a(event.content.parts)
             # parts = event.content.parts
             updater.add_artifact(parts)
             updater.complete()
-            return
+            return parts
         if not event.get_function_calls():
-            updater.update_status(
-                TaskState.working,
-                message=updater.new_agent_message(
-                    utils.convert_genai_parts_to_a2a(event.content.parts),
-                    # event.content.parts,
-                ),
-            )
+            self._working(updater, utils.convert_genai_parts_to_a2a(event.content.parts), emit)
+            # self._working(updater, event.content.parts, emit)
     
     # Helper functions
+    def _priority(self, context: RequestContext) -> int:
+        metadata = context.message.metadata or {}
+        priority = metadata.get("priority", "default")
+        if priority == "paid" and PRIORITY_TOKEN and metadata.get("priority_token") != PRIORITY_TOKEN:
+            priority = "default"
+        return PRIORITIES.get(priority, PRIORITIES["default"])
+
+    def _working(self, updater: TaskUpdater, parts: list[Part], emit=None, metadata: dict | None = None):
+        """Posts a working update, and passes it on to requests sharing this run"""
+        updater.update_status(TaskState.working, message=updater.new_agent_message(parts, metadata))
+        if emit:
+            emit((parts, metadata))
+
+    async def _remember(self, context: RequestContext, user_query: types.UserContent, parts: list[Part]):
+        """Starts the conversation's session with a cached report, so a follow-up has it in context"""
+        if self.stateless:
+            return
+        session = await self._get_session(context)
+        invocation_id = Event.new_id()
+        for author, content in (
+            ("user", user_query),
+            (self.runner.agent.name, types.ModelContent(parts=utils.convert_a2a_parts_to_genai(parts))),
+        ):
+            await self.runner.session_service.append_event(
+                session, Event(invocation_id=invocation_id, author=author, content=content),
+            )
+
+    async def _has_session(self, context: RequestContext) -> bool:
+        return await self.runner.session_service.get_session(
+            app_name=self.runner.app_name, user_id="anonymous", session_id=context.context_id,
+        ) is not None
+
     async def _get_session(self, context: RequestContext):
         session = await self.runner.session_service.get_session(
             app_name=self.runner.app_name, 
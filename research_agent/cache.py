@@ -0,0 +1,94 @@
+import json, logging, os, sqlite3, threading, time
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as cache key"""
+    return " ".join(query.lower().split())
+
+
+# ────────────────── cache ──────────────────
+class SqliteCache:
+    """
+    Key-value cache with TTL expiry and LRU eviction, backed by SQLite
+
+    Values must be JSON-serialisable. Entries older than `ttl` seconds count as misses.
+    When `max_entries` or `max_bytes` is exceeded, least recently used entries are evicted.
+    Pass ":memory:" as `path` for a cache that does not survive restarts.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, max_entries: int = 10_000, max_bytes: int | None = None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode()), now, now),
+            )
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # Helper functions
+    def _evict(self):
+        self._db.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,))
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        excess = max(entries - self.max_entries, 0)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Drop LRU entries until the total size fits
+            freed = 0
+            for i, (row_size,) in enumerate(self._db.execute("SELECT size FROM cache ORDER BY accessed")):
+                if size - freed <= self.max_bytes:
+                    excess = max(excess, i)
+                    break
+                freed += row_size
+            else:
+                excess = entries
+        if excess:
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            logger.debug(f"Evicted {excess} cache entries from {self.path}")
@@ -0,0 +1,220 @@
+import arxiv, click, contextlib, gzip, json, logging, os, re, sqlite3, threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+
+SEARCH_BACKENDS = ("api", "local")
+PAGE_SIZE = 10  # search_papers never asks for more
+
+logger = logging.getLogger(__name__)
+
+# One client, so its delay between requests holds across all searches; the lock keeps
+# concurrent searches from slipping past that delay together
+ARXIV_CLIENT = arxiv.Client(page_size=PAGE_SIZE)
+_ARXIV_LOCK = threading.Lock()
+
+
+# ────────────────── arXiv API backend ──────────────────
+class ArxivApiBackend:
+    """
+    Searches the public arXiv API
+
+    Slow and rate-limited, so results are worth caching.
+    """
+
+    name = "api"
+    cacheable = True
+
+    def search(self, query: str, max_results: int, categories: list[str], since: str) -> list[dict]:
+        query = f"({query.strip()})"
+        if categories:
+            cats = " OR ".join(f"cat:{category}" for category in categories)
+            query = f"({cats}) AND {query}"
+        # The date goes into the query, so the top results by relevance are all recent enough
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", since):
+            query += f" AND submittedDate:[{since.replace('-', '')}0000 TO 999912312359]"
+        search = arxiv.Search(
+            query = query,
+            max_results = max_results,
+            sort_by = arxiv.SortCriterion.Relevance
+        )
+        papers = []
+        with _ARXIV_LOCK:
+            for result in ARXIV_CLIENT.results(search):
+                papers.append({
+                    "title": result.title,
+                    "summary": result.summary,
+                    "authors": [author.name for author in result.authors],
+                    "categories": result.categories,
+                    "published": result.published.strftime('%Y-%m-%d'),
+                    "url": result.entry_id,
+                })
+        return [paper for paper in papers if paper["published"] >= since]
+
+
+# ────────────────── local index backend ──────────────────
+class LocalIndexBackend:
+    """
+    BM25 search over a local arXiv metadata snapshot
+
+    Titles and abstracts live in an SQLite FTS5 inverted index next to the
+    paper metadata, so queries never leave the machine. Fill it with `ingest()`
+    from the arXiv metadata dump (one JSON object per line, optionally gzipped);
+    re-ingesting a newer dump only updates changed papers.
+    """
+
+    name = "local"
+    cacheable = False
+    TITLE_WEIGHT = 2.0  # BM25 weight of title matches relative to abstract matches
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with contextlib.closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def search(self, query: str, max_results: int, categories: list[str], since: str) -> list[dict]:
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        sql = (
+            "SELECT p.title, p.summary, p.authors, p.categories, p.published, p.url "
+            "FROM papers_fts JOIN papers p ON p.rowid = papers_fts.rowid "
+            "WHERE papers_fts MATCH ? AND p.published >= ?"
+        )
+        params = [" OR ".join(f'"{term}"' for term in terms), since]
+        if categories:
+            sql += " AND (" + " OR ".join("(' ' || p.categories || ' ') LIKE ?" for _ in categories) + ")"
+            params += [f"% {category} %" for category in categories]
+        sql += f" ORDER BY bm25(papers_fts, {self.TITLE_WEIGHT}, 1.0) LIMIT ?"
+        params.append(max_results)
+        return [
+            {
+                "title": title,
+                "summary": summary,
+                "authors": json.loads(authors),
+                "categories": cats.split(),
+                "published": published,
+                "url": url,
+            }
+            for title, summary, authors, cats, published, url in self._db().execute(sql, params)
+        ]
+
+    def ingest(self, dump_path: str, batch_size: int = 5000) -> int:
+        """Adds or updates the papers in a metadata dump and returns how many rows were read"""
+        opener = gzip.open if dump_path.endswith(".gz") else open
+        count = 0
+        with opener(dump_path, "rt", encoding="utf-8") as f, contextlib.closing(self._connect()) as db:
+            batch = []
+            for line in f:
+                if line.strip():
+                    batch.append(_paper_row(json.loads(line)))
+                if len(batch) >= batch_size:
+                    count += self._upsert(db, batch)
+                    batch = []
+            count += self._upsert(db, batch)
+            db.execute("INSERT INTO papers_fts (papers_fts) VALUES ('optimize')")
+            db.commit()
+        logger.info(f"Ingested {count} papers from {dump_path} into {self.path}")
+        return count
+
+    def stats(self) -> dict:
+        papers, = self._db().execute("SELECT COUNT(*) FROM papers").fetchone()
+        return {"papers": papers, "bytes": os.path.getsize(self.path)}
+
+    # Helper functions
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between the worker threads searches run in
+        if not hasattr(self._local, "db"):
+            self._local.db = self._connect()
+        return self._local.db
+
+    def _upsert(self, db: sqlite3.Connection, rows: list[tuple]) -> int:
+        db.executemany(
+            "INSERT INTO papers (arxiv_id, title, summary, authors, categories, published, updated, url) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (arxiv_id) DO UPDATE SET title = excluded.title, summary = excluded.summary, "
+            "authors = excluded.authors, categories = excluded.categories, published = excluded.published, "
+            "updated = excluded.updated, url = excluded.url WHERE excluded.updated > papers.updated",
+            rows,
+        )
+        db.commit()
+        return len(rows)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    rowid INTEGER PRIMARY KEY,
+    arxiv_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    published TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_published ON papers (published);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5 (
+    title, summary, content='papers', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+    INSERT INTO papers_fts (papers_fts, rowid, title, summary) VALUES ('delete', old.rowid, old.title, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+    INSERT INTO papers_fts (papers_fts, rowid, title, summary) VALUES ('delete', old.rowid, old.title, old.summary);
+    INSERT INTO papers_fts (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+END;
+"""
+
+
+def _paper_row(record: dict) -> tuple:
+    """Converts one record of the arXiv metadata dump into a `papers` row"""
+    versions = record.get("versions") or []
+    if versions:
+        published = parsedate_to_datetime(versions[0]["created"]).strftime("%Y-%m-%d")
+    else:
+        published = record["update_date"]
+    if record.get("authors_parsed"):
+        authors = [" ".join(filter(None, [first, last])) for last, first, *_ in record["authors_parsed"]]
+    else:
+        authors = [name.strip() for name in record.get("authors", "").split(",") if name.strip()]
+    version = versions[-1]["version"] if versions else ""
+    return (
+        record["id"],
+        " ".join(record["title"].split()),
+        " ".join(record["abstract"].split()),
+        json.dumps(authors, ensure_ascii=False),
+        record.get("categories", ""),
+        published,
+        record.get("update_date") or published,
+        f"http://arxiv.org/abs/{record['id']}{version}",
+    )
+
+
+# ────────────────── ingestion CLI ──────────────────
+@click.command()
+@click.argument('dumps', nargs=-1, required=True)
+@click.option('--index', 'index_path', default='.cache/arxiv_index.sqlite')
+
+def main(dumps, index_path):
+    """Ingests arXiv metadata dumps into the local search index"""
+    logging.basicConfig(level=logging.INFO)
+    backend = LocalIndexBackend(index_path)
+    start = datetime.now()
+    for dump in dumps:
+        backend.ingest(dump)
+    logger.info(f"Index holds {backend.stats()['papers']} papers ({datetime.now() - start} elapsed)")
+
+
+if __name__ == '__main__':
+    main()
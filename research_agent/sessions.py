@@ -0,0 +1,88 @@
+import logging, time
+from collections import OrderedDict
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+
+
+SESSION_TTL = 3600  # seconds a session may sit idle
+MAX_SESSIONS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── session service ──────────────────
+class BoundedSessionService(InMemorySessionService):
+    """
+    InMemorySessionService that evicts idle, least recently used and oversized sessions
+
+    Sessions unused for `idle_ttl` seconds are dropped, and beyond `max_sessions`
+    sessions or `max_bytes` of stored events the least recently used go first.
+    Eviction runs whenever a session is created or grows. A runner that is still
+    using an evicted session keeps its own copy, so only later turns are affected.
+    """
+
+    def __init__(self, idle_ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS, max_bytes: int | None = None):
+        super().__init__()
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evicted = 0
+        self._usage: OrderedDict[tuple[str, str, str], list] = OrderedDict()  # key -> [last used, bytes]
+
+    async def create_session(self, *, app_name: str, user_id: str, **kwargs) -> Session:
+        session = await super().create_session(app_name=app_name, user_id=user_id, **kwargs)
+        self._touch((app_name, user_id, session.id))
+        self._evict()
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, **kwargs) -> Session | None:
+        session = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, **kwargs)
+        if session is not None:
+            self._touch((app_name, user_id, session_id))
+        return session
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        key = (session.app_name, session.user_id, session.id)
+        if key in self._usage and not event.partial:
+            self._touch(key, len(event.model_dump_json(exclude_none=True)))
+            self._evict()
+        return event
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str):
+        self._drop((app_name, user_id, session_id))
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._usage), "bytes": self.bytes, "evicted": self.evicted}
+
+    # Helper functions
+    def _touch(self, key: tuple[str, str, str], size: int = 0):
+        usage = self._usage.setdefault(key, [0.0, 0])
+        usage[0] = time.monotonic()
+        usage[1] += size
+        self.bytes += size
+        self._usage.move_to_end(key)
+
+    def _evict(self):
+        # Least recently used first, so idle sessions are all at the front
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._usage:
+            key, (last_used, _) = next(iter(self._usage.items()))
+            over = len(self._usage) > self.max_sessions or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            if last_used >= cutoff and not over:
+                break
+            self._drop(key)
+            self.evicted += 1
+
+    def _drop(self, key: tuple[str, str, str]):
+        app_name, user_id, session_id = key
+        usage = self._usage.pop(key, None)
+        if usage:
+            self.bytes -= usage[1]
+        sessions = self.sessions.get(app_name, {}).get(user_id)
+        if sessions is not None:
+            sessions.pop(session_id, None)
+            if not sessions:
+                del self.sessions[app_name][user_id]
@@ -0,0 +1,282 @@
+"""
+BillingContract.sol on an in-process eth-tester chain
+
+Compiles the contract with py-solc-x (installing SOLC_VERSION on first use)
+and runs the prepaid voucher flow end to end: deposit, a voucher signed with
+the same code the user agent uses, settlement, and withdrawal after the delay.
+
+Where solc can't be installed, the tests run against the precompiled
+BillingContract.json instead, as long as it was built from the current source.
+Rebuild it after changing the contract with `python3 tests/test_billing_contract.py`.
+"""
+import click, hashlib, json, os, sys
+
+import pytest
+from eth_abi import encode
+from web3 import EthereumTesterProvider, Web3
+from web3.exceptions import ContractLogicError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.vouchers import sign_voucher, voucher_message
+
+
+SOLC_VERSION = os.getenv("SOLC_VERSION", "0.8.20")
+SOURCE = os.path.join(ROOT, "BillingContract.sol")
+ARTIFACT = os.path.join(ROOT, "BillingContract.json")
+PRICE = 10**18
+DAY = 24 * 3600
+
+
+def compile_contract() -> dict:
+    """ABI and bytecode of PaymentContract, built the same way on every machine so they can be compared"""
+    import solcx
+    if SOLC_VERSION not in {str(version) for version in solcx.get_installed_solc_versions()}:
+        solcx.install_solc(SOLC_VERSION)
+    with open(SOURCE, "r", encoding="utf-8") as f:
+        source = f.read()
+    # A fixed source name keeps the metadata hash at the end of the bytecode independent of the checkout path
+    output = solcx.compile_standard({
+        "language": "Solidity",
+        "sources": {"BillingContract.sol": {"content": source}},
+        "settings": {"outputSelection": {"*": {"PaymentContract": ["abi", "evm.bytecode.object"]}}},
+    }, solc_version=SOLC_VERSION)
+    contract = output["contracts"]["BillingContract.sol"]["PaymentContract"]
+    return {
+        "solc": SOLC_VERSION,
+        "source_sha256": _source_hash(),
+        "abi": contract["abi"],
+        "bin": contract["evm"]["bytecode"]["object"],
+    }
+
+
+def load_artifact() -> dict | None:
+    """The precompiled contract, if it was built from the current source"""
+    try:
+        with open(ARTIFACT, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return None
+    return artifact if artifact["source_sha256"] == _source_hash() else None
+
+
+@pytest.fixture(scope="module")
+def compiled() -> dict:
+    try:
+        return compile_contract()
+    except Exception as e:
+        error = e
+    artifact = load_artifact()
+    if artifact is None:
+        pytest.skip(
+            f"solc {SOLC_VERSION} unavailable ({error}) and {os.path.basename(ARTIFACT)} missing or built from an "
+            f"older BillingContract.sol; rebuild it with `python3 tests/test_billing_contract.py`"
+        )
+    return artifact
+
+
+@pytest.fixture
+def chain(compiled):
+    provider = EthereumTesterProvider()
+    w3 = Web3(provider)
+    owner, buyer, other = w3.eth.accounts[:3]
+    keys = provider.ethereum_tester.backend.account_keys
+    txh = w3.eth.contract(abi=compiled["abi"], bytecode=compiled["bin"]).constructor(PRICE).transact({"from": owner})
+    address = w3.eth.wait_for_transaction_receipt(txh)["contractAddress"]
+
+    class Chain:
+        pass
+    c = Chain()
+    c.w3, c.tester = w3, provider.ethereum_tester
+    c.contract = w3.eth.contract(address=address, abi=compiled["abi"])
+    c.owner, c.buyer, c.other = owner, buyer, other
+    c.buyer_account = w3.eth.account.from_key(keys[1].to_hex())
+    c.other_account = w3.eth.account.from_key(keys[2].to_hex())
+    return c
+
+
+# Helper functions
+def _source_hash() -> str:
+    with open(SOURCE, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def voucher(chain, content_id: str, amount: int, account=None, payer: str | None = None) -> tuple[tuple, bytes]:
+    account = account or chain.buyer_account
+    signature = sign_voucher(account, chain.w3.eth.chain_id, chain.contract.address, content_id, amount)
+    return (payer or account.address, Web3.keccak(text=content_id), amount), bytes.fromhex(signature[2:])
+
+
+def settle(chain, *signed) -> int:
+    """Settles the vouchers as the owner and returns the amount the contract reported as settled"""
+    vouchers, signatures = [v for v, _ in signed], [s for _, s in signed]
+    function = chain.contract.functions.settleVouchers(vouchers, signatures)
+    settled = function.call({"from": chain.owner})
+    chain.w3.eth.wait_for_transaction_receipt(function.transact({"from": chain.owner}))
+    return settled
+
+
+def transact(chain, function, sender: str, value: int = 0) -> int:
+    """Sends a transaction and returns the wei it cost in gas"""
+    receipt = chain.w3.eth.wait_for_transaction_receipt(function.transact({"from": sender, "value": value}))
+    assert receipt["status"] == 1
+    return receipt["gasUsed"] * receipt["effectiveGasPrice"]
+
+
+def paid(chain, payer: str, content_id: str) -> bool:
+    return chain.contract.functions.paidContent(payer, Web3.keccak(text=content_id)).call()
+
+
+# ────────────────── tests ──────────────────
+def test_voucher_digest_matches_contract_encoding():
+    """The typed data the agents sign hashes to the digest _voucherSigner rebuilds, without needing solc"""
+    chain_id, contract, payer, amount = 1234, "0x" + "ab" * 20, "0x" + "cd" * 20, 3 * PRICE
+    domain_separator = Web3.keccak(encode(
+        ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+        [
+            Web3.keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"),
+            Web3.keccak(text="PaymentContract"), Web3.keccak(text="1"), chain_id, contract,
+        ],
+    ))
+    struct_hash = Web3.keccak(encode(
+        ["bytes32", "address", "bytes32", "uint256"],
+        [Web3.keccak(text="Voucher(address payer,bytes32 contentId,uint256 amount)"), payer, Web3.keccak(text="cid"), amount],
+    ))
+    digest = Web3.keccak(b"\x19\x01" + domain_separator + struct_hash)
+    message = voucher_message(chain_id, contract, payer, "cid", amount)
+    assert Web3.keccak(b"\x19" + message.version + message.header + message.body) == digest
+
+
+def test_contract_abi_json_matches_contract(compiled):
+    """Everything the agents call through contract_abi.json exists in the compiled contract"""
+    with open(os.path.join(ROOT, "billing_agent", "contract_abi.json"), "r") as f:
+        shipped = json.load(f)
+    signature = lambda item: (item["type"], item.get("name"), json.dumps(item.get("inputs", []), sort_keys=True))
+    assert set(map(signature, shipped)) <= set(map(signature, compiled["abi"]))
+
+
+def test_artifact_matches_source():
+    """The precompiled contract is what solc builds from the current source"""
+    artifact = load_artifact()
+    if artifact is None:
+        pytest.skip(f"{os.path.basename(ARTIFACT)} missing or built from an older BillingContract.sol")
+    try:
+        built = compile_contract()
+    except Exception as e:
+        pytest.skip(f"solc {SOLC_VERSION} unavailable: {e}")
+    assert (artifact["abi"], artifact["bin"]) == (built["abi"], built["bin"])
+
+
+def test_deposit_voucher_settle(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 3 * PRICE)
+    assert chain.contract.functions.deposits(chain.buyer).call() == 3 * PRICE
+    owner_before = chain.w3.eth.get_balance(chain.owner)
+
+    assert settle(chain, voucher(chain, "cid-1", PRICE), voucher(chain, "cid-2", PRICE)) == 2 * PRICE
+
+    assert paid(chain, chain.buyer, "cid-1") and paid(chain, chain.buyer, "cid-2")
+    assert chain.contract.functions.deposits(chain.buyer).call() == PRICE
+    assert chain.contract.functions.totalDeposits().call() == PRICE
+    assert chain.w3.eth.get_balance(chain.contract.address) == PRICE
+    logs = chain.contract.events.PaymentReceived.get_logs(from_block=0)
+    assert [(log.args.user, log.args.amount) for log in logs] == [(chain.buyer, PRICE)] * 2
+    # Settlement gas is paid by the owner, so only a lower bound holds
+    assert chain.w3.eth.get_balance(chain.owner) > owner_before + PRICE
+
+
+def test_replayed_voucher_is_skipped(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 3 * PRICE)
+    signed = voucher(chain, "cid-1", PRICE)
+    assert settle(chain, signed) == PRICE
+    assert settle(chain, signed) == 0
+    # A replay within one batch is skipped too
+    assert settle(chain, voucher(chain, "cid-2", PRICE), voucher(chain, "cid-2", PRICE)) == PRICE
+    assert chain.contract.functions.deposits(chain.buyer).call() == PRICE
+
+
+def test_overspent_voucher_is_skipped(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 2 * PRICE)
+    assert settle(chain, voucher(chain, "too-much", 3 * PRICE)) == 0
+    # Each voucher is covered on its own, but not both together
+    assert settle(chain, voucher(chain, "cid-1", 2 * PRICE), voucher(chain, "cid-2", PRICE)) == 2 * PRICE
+    assert not paid(chain, chain.buyer, "cid-2")
+    assert chain.contract.functions.deposits(chain.buyer).call() == 0
+    assert chain.contract.functions.totalDeposits().call() == 0
+
+
+def test_forged_or_underpriced_voucher_is_skipped(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 3 * PRICE)
+    # Signed by someone else on the buyer's behalf
+    forged = voucher(chain, "cid-1", PRICE, account=chain.other_account, payer=chain.buyer)
+    # Amount raised after signing
+    (payer, content, _), signature = voucher(chain, "cid-2", PRICE)
+    tampered = ((payer, content, 2 * PRICE), signature)
+    underpriced = voucher(chain, "cid-3", PRICE - 1)
+    truncated = (voucher(chain, "cid-4", PRICE)[0], b"\x00" * 64)
+    assert settle(chain, forged, tampered, underpriced, truncated) == 0
+    assert chain.contract.functions.deposits(chain.buyer).call() == 3 * PRICE
+
+
+def test_only_owner_settles(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, PRICE)
+    v, s = voucher(chain, "cid-1", PRICE)
+    with pytest.raises(ContractLogicError, match="Not the contract owner"):
+        chain.contract.functions.settleVouchers([v], [s]).transact({"from": chain.buyer})
+
+
+def test_withdraw_after_delay(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 2 * PRICE)
+    settle(chain, voucher(chain, "cid-1", PRICE))
+    with pytest.raises(ContractLogicError, match="Withdrawal not available yet"):
+        chain.contract.functions.withdrawDeposit().transact({"from": chain.buyer})
+
+    transact(chain, chain.contract.functions.requestWithdrawal(), chain.buyer)
+    available = chain.contract.functions.withdrawAfter(chain.buyer).call()
+    assert available >= chain.w3.eth.get_block("latest")["timestamp"] + DAY
+    with pytest.raises(ContractLogicError, match="Withdrawal not available yet"):
+        chain.contract.functions.withdrawDeposit().transact({"from": chain.buyer})
+
+    chain.tester.time_travel(available + 1)
+    before = chain.w3.eth.get_balance(chain.buyer)
+    gas = transact(chain, chain.contract.functions.withdrawDeposit(), chain.buyer)
+    assert chain.w3.eth.get_balance(chain.buyer) == before - gas + PRICE
+    assert chain.contract.functions.deposits(chain.buyer).call() == 0
+    assert chain.contract.functions.totalDeposits().call() == 0
+    assert chain.contract.functions.withdrawAfter(chain.buyer).call() == 0
+
+
+def test_deposit_cancels_withdrawal_request(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, PRICE)
+    transact(chain, chain.contract.functions.requestWithdrawal(), chain.buyer)
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, PRICE)
+    assert chain.contract.functions.withdrawAfter(chain.buyer).call() == 0
+
+
+def test_owner_withdraw_keeps_deposits(chain):
+    transact(chain, chain.contract.functions.deposit(), chain.buyer, 2 * PRICE)
+    transact(chain, chain.contract.functions.makePayment(Web3.keccak(text="direct")), chain.other, PRICE)
+    before = chain.w3.eth.get_balance(chain.owner)
+
+    gas = transact(chain, chain.contract.functions.withdraw(), chain.owner)
+
+    assert chain.w3.eth.get_balance(chain.owner) == before - gas + PRICE
+    assert chain.w3.eth.get_balance(chain.contract.address) == 2 * PRICE
+    # The buyer's deposit is still there to be spent or withdrawn
+    assert settle(chain, voucher(chain, "cid-1", PRICE)) == PRICE
+    assert chain.w3.eth.get_balance(chain.contract.address) == PRICE
+
+
+# ────────────────── artifact CLI ──────────────────
+@click.command()
+def main():
+    """Rebuilds BillingContract.json, the precompiled contract used where solc is unavailable"""
+    artifact = compile_contract()
+    with open(ARTIFACT, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2)
+        f.write("\n")
+    click.echo(f"Wrote {ARTIFACT} (solc {artifact['solc']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,25 @@
+import asyncio
 import click
+import contextlib
 import logging
-import uvicorn
+import os
+import sys
+
+# common/ lives at the repository root, next to this agent's directory
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
 from a2a.types import AgentCapabilities, AgentCard, AgentSkill
-from agent_executor import UserAgentExecutor
+from starlette.middleware import Middleware
+
+from common.metrics import METRICS, MetricsMiddleware, observe_peer
+from common.remote import PEER_MODES, PushReceiver
+from common.serving import serve, worker_index
+from common.task_store import SqliteTaskStore
+from common.tracing import setup_tracing
+
+from agent_executor import PAYMENT_MODES, UserAgentExecutor
 
 
 logging.basicConfig()
@@ -14,8 +27,34 @@ logging.basicConfig()
 @click.command()
 @click.option('--host', default='localhost')  # example
 @click.option('--port', default=10000)        # example
+@click.option(                                # how to follow tasks on remote agents
+    '--peer-mode', 'peer_mode', type=click.Choice(PEER_MODES), default='stream'
+)
+@click.option('--max-connections', 'max_connections', default=20)  # per remote agent
+@click.option('--http2/--no-http2', default=False)  # requires the 'h2' package
+@click.option(                                # public URL for push callbacks, defaults to http://host:port
+    '--callback-url', 'callback_url', default=None
+)
+@click.option(                                # pay on-chain per request, or with vouchers against a deposit
+    '--payment-mode', 'payment_mode', type=click.Choice(PAYMENT_MODES), default='onchain'
+)
+@click.option(                                # task history, ":memory:" or a SQLite file
+    '--task-store', 'task_store_path', default='.cache/user_tasks.sqlite'
+)
+@click.option('--task-ttl', 'task_ttl', default=24 * 3600)  # seconds finished tasks are kept
+@click.option('--pending-task-ttl', 'pending_task_ttl', default=7 * 24 * 3600)  # seconds unfinished tasks are kept
+@click.option('--workers', default=1)         # server processes, each paying from its own share of the wallets
+@click.option('--trace-file', 'trace_file', default=None)  # spans as JSONL, e.g. .cache/traces/user.jsonl
+@click.option('--trace-otlp', 'trace_otlp', default=None)  # OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces
 
-def main(host, port):
+def main(host, port, peer_mode, max_connections, http2, callback_url, payment_mode, task_store_path, task_ttl, pending_task_ttl, workers,
+         trace_file, trace_otlp):
+    if workers > 1:
+        if task_store_path == ':memory:':
+            raise click.UsageError("--workers needs a --task-store file the workers can share")
+        if peer_mode == 'push':
+            # Push callback inboxes are kept per process
+            raise click.UsageError("--peer-mode push needs a single worker")
     # 1. 스킬 메타데이터 설정
     skill = AgentSkill(
         id="commission_agent",
@@ -37,15 +76,38 @@ def main(host, port):
         skills=[skill]
     )
     # 3. 에이전트 서버 실행
-    request_handler = DefaultRequestHandler(
-        agent_executor=UserAgentExecutor(),
-        task_store=InMemoryTaskStore(),
-    )
-    server = A2AStarletteApplication(
-        agent_card=agent_card,
-        http_handler=request_handler
-    )
-    uvicorn.run(server.build(), host=host, port=port)
+    # Each worker process builds its own app; state they share lives in SQLite files
+    def build_app():
+        tracer_provider = setup_tracing("user-agent", trace_file, trace_otlp)
+        receiver = PushReceiver(callback_url or f'http://{host}:{port}') if peer_mode == 'push' else None
+        agent_executor = UserAgentExecutor(
+            peer_mode, payment_mode, worker_index(),
+            max_connections=max_connections, http2=http2, receiver=receiver, on_send=observe_peer,
+        )
+        task_store = SqliteTaskStore(task_store_path, ttl=task_ttl, pending_ttl=pending_task_ttl, shared=workers > 1)
+        METRICS.collect("task_store", lambda: asyncio.to_thread(task_store.stats))
+        METRICS.collect("wallet", lambda: {"lanes": agent_executor.payments.stats()})  # per-address nonce and in_flight
+        request_handler = DefaultRequestHandler(
+            agent_executor=agent_executor,
+            task_store=task_store,
+        )
+        server = A2AStarletteApplication(
+            agent_card=agent_card,
+            http_handler=request_handler
+        )
+        # Remote agent connections and the task store are closed on server shutdown
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            METRICS.start()
+            yield
+            await METRICS.stop()
+            await agent_executor.aclose()
+            await task_store.close()
+            if tracer_provider:
+                tracer_provider.shutdown()
+        routes = [METRICS.route()] + ([receiver.route()] if receiver else [])
+        return server.build(routes=routes, middleware=[Middleware(MetricsMiddleware)], lifespan=lifespan)
+    serve(build_app, host, port, workers)
 
 
 if __name__ == '__main__':
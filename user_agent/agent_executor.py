@@ -1,34 +1,42 @@
-import asyncio, httpx, json, logging, os
+import json, logging, os
 from dotenv import load_dotenv
 from uuid import uuid4
-from web3 import Web3
-from eth_account import Account
+from web3 import AsyncWeb3
 
-from a2a.client import A2AClient
+from a2a.client import A2AClientError
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events.event_queue import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
-    Message, MessageSendParams, SendMessageRequest, TaskQueryParams,
-    GetTaskRequest, Part, TextPart,
+    Message, Part, TextPart, TaskArtifactUpdateEvent,
     TaskState, UnsupportedOperationError,
 )
+from a2a.utils import get_message_text
 from a2a.utils.errors import ServerError
+from opentelemetry import trace
+
+from common.metrics import EXECUTIONS, RpcMetrics
+from common.remote import RemoteAgentPool, UpdateEvent
+from common.tracing import extract
+
+from payments import PaymentEngine, PaymentPending
 
 
 # ────────────────── blockchain / contract config ──────────────────
 load_dotenv()
 
-WORLDLAND_RPC_URL = "https://seoul.worldland.foundation/"
-w3 = Web3(Web3.HTTPProvider(WORLDLAND_RPC_URL))
+WORLDLAND_RPC_URL = os.getenv("RPC_URL", "https://seoul.worldland.foundation/")
+w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(WORLDLAND_RPC_URL))
+w3.middleware_onion.add(RpcMetrics)
 
-PRIVATE_KEY_USER  = os.getenv("PRIVATE_KEY_USER")
-acct = Account.from_key(PRIVATE_KEY_USER)
+# Comma-separated hot wallet keys; payments are spread across all of them
+PRIVATE_KEYS_USER = os.getenv("PRIVATE_KEYS_USER") or os.getenv("PRIVATE_KEY_USER") or ""
 
-POLL_DELAY = 3  # seconds
+PAYMENT_MODES = ("onchain", "voucher")
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+tracer = trace.get_tracer(__name__)
 
 
 # ────────────────── executor ──────────────────
@@ -38,9 +46,28 @@ class UserAgentExecutor(AgentExecutor):
 
     Sends query → receives invoice → pays → sends contentId → receives content
     """
+
+    # Initialization
+    def __init__(
+        self, peer_mode: str = "stream", payment_mode: str = "onchain",
+        wallet_shard: tuple[int, int] = (0, 1), **pool_options,
+    ):
+        self.remotes = RemoteAgentPool(peer_mode, **pool_options)
+        self.payment_mode = payment_mode
+        # Worker i of n pays from every n-th wallet so no two processes share a nonce sequence
+        keys = [key.strip() for key in PRIVATE_KEYS_USER.split(",") if key.strip()]
+        index, count = wallet_shard
+        if keys and len(keys) < count:
+            raise ValueError(f"{count} workers need at least {count} wallets in PRIVATE_KEYS_USER")
+        self.payments = PaymentEngine(w3, keys[index::count], voucher_key=keys[0] if keys else None)
     
     # Core pipeline
     async def execute(self, context: RequestContext, event_queue: EventQueue):
+        # Continues the trace the client started, if it sent one along
+        with tracer.start_as_current_span("user.execute", context=extract(context.message.metadata)), EXECUTIONS.track_inprogress():
+            await self._execute(context, event_queue)
+
+    async def _execute(self, context: RequestContext, event_queue: EventQueue):
         updater = TaskUpdater(event_queue, context.task_id, context.context_id)
         if not context.current_task:
             updater.submit()
@@ -48,102 +75,98 @@ class UserAgentExecutor(AgentExecutor):
 
         user_query = context.message.parts[0].root.text.strip()
         remote_url = context.message.parts[1].root.text.strip()
-        async with httpx.AsyncClient(timeout=60) as httpx_client:
-            client = A2AClient(httpx_client=httpx_client, url=remote_url)
+        remote = self.remotes.get(remote_url)
+        try:
             # 1) Send query
-            self._update_status(updater, "Sending query...")
-            resp = await client.send_message(
-                SendMessageRequest(
-                    id=str(uuid4()),
-                    params=MessageSendParams(
-                        message=Message(
-                            contextId=context.context_id,
-                            role="user",
-                            messageId=str(uuid4()),
-                            parts=[Part(TextPart(text=user_query))]
-                        )
-                    )
-                )
-            )
             # Wait until hitting INPUT_REQUIRED and get invoice
-            self._update_status(updater, "Waiting for invoice...")
-            task = resp.root.result
-            while task.status.state == TaskState.working:
-                await asyncio.sleep(POLL_DELAY)
-                gt = await client.get_task(
-                    GetTaskRequest(
-                        id=str(uuid4()),
-                        params=TaskQueryParams(id=task.id))
+            self._update_status(updater, "Sending query...")
+            with tracer.start_as_current_span("user.invoice"):
+                task = await remote.send(
+                    Message(
+                        contextId=context.context_id,
+                        role="user",
+                        messageId=str(uuid4()),
+                        parts=[Part(TextPart(text=user_query))]
+                    ),
+                    self._forward(updater),
                 )
-                task = gt.root.result
-
-            if task.status.state != TaskState.input_required:
-                return self._update_fail(updater, "Owner agent did not issue invoice")
-
-            invoice = json.loads(task.status.message.parts[0].root.text)
-            content_id = invoice["contentId"]
-            contract   = w3.eth.contract(address=invoice["contract"], abi=invoice["abi"])
-            price_wei  = int(invoice["priceWei"])
-
-            # 2) Pay owner
+        except A2AClientError as e:
+            return self._update_fail(updater, f"Owner agent unreachable: {e}")
+
+        if task.status.state != TaskState.input_required:
+            return self._update_fail(updater, "Owner agent did not issue invoice")
+
+        invoice = json.loads(task.status.message.parts[0].root.text)
+        content_id = invoice["contentId"]
+        contract   = w3.eth.contract(address=invoice["contract"], abi=invoice["abi"])
+        price_wei  = int(invoice["priceWei"])
+
+        # 2) Pay owner
+        # With a prepaid deposit, a signed voucher replaces the on-chain payment
+        proof = []
+        if self.payment_mode == "voucher" and invoice.get("vouchers"):
+            self._update_status(updater, "Signing voucher...")
+            with tracer.start_as_current_span("user.voucher_sign"):
+                payer_addr, signature = self.payments.voucher(invoice["chainId"], invoice["contract"], content_id, price_wei)
+            proof = [Part(TextPart(text=signature))]
+        else:
             self._update_status(updater, "Paying contract...")
-            txh = await asyncio.to_thread(self._pay_contract, contract, content_id, price_wei)
-            await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, txh)
-
-            # 3) Send contentId to owner
-            self._update_status(updater, "Sending contentId...")
-            resp2 = await client.send_message(
-                SendMessageRequest(
-                    id=str(uuid4()),
-                    params=MessageSendParams(
-                        message=Message(
-                            contextId=context.context_id,
-                            taskId=task.id,  # continue same task
-                            role="user",
-                            messageId=str(uuid4()),
-                            parts=[
-                                Part(TextPart(text=content_id)),
-                                Part(TextPart(text=acct.address)),
-                            ]
-                        )
+            try:
+                with tracer.start_as_current_span("user.payment", attributes={"price_wei": price_wei}):
+                    payer_addr = await self.payments.pay(
+                        contract, content_id, price_wei,
+                        lambda: self._update_status(updater, "Waiting for confirmation..."),
                     )
+            except PaymentPending as e:
+                # Not failed: the transaction may still be mined and charge the user
+                return self._update_fail(
+                    updater, f"Payment pending: {e.tx_hash} is not confirmed yet. Check it before paying again.",
                 )
-            )
-
-            # 4) Poll until completed
-            self._update_status(updater, "Waiting for generated content...")
-            t2 = resp2.root.result
-            # t2 = resp.root.result
-            while t2.status.state not in (TaskState.completed, TaskState.failed):
-                await asyncio.sleep(POLL_DELAY)
-                gt = await client.get_task(
-                    GetTaskRequest(
-                        id=str(uuid4()),
-                        params=TaskQueryParams(id=t2.id))
+            except Exception as e:
+                return self._update_fail(updater, f"Payment failed: {e}")
+
+        # 3) Send contentId to owner
+        # Artifacts are forwarded as they arrive, until completed
+        self._update_status(updater, "Sending contentId...")
+        try:
+            with tracer.start_as_current_span("user.content"):
+                t2 = await remote.send(
+                    Message(
+                        contextId=context.context_id,
+                        taskId=task.id,  # continue same task
+                        role="user",
+                        messageId=str(uuid4()),
+                        parts=[
+                            Part(TextPart(text=content_id)),
+                            Part(TextPart(text=payer_addr)),
+                            *proof,
+                        ]
+                    ),
+                    self._forward(updater),
                 )
-                t2 = gt.root.result
-
-            if t2.status.state == TaskState.completed:
-                updater.add_artifact(t2.artifacts[0].parts)
-                updater.complete()
-                logger.debug(f"Task completed")
-            else:
-                self._update_fail(updater, "Owner agent failed: "+t2.status.message.parts[0].root.text)
+        except A2AClientError as e:
+            return self._update_fail(updater, f"Owner agent unreachable: {e}")
+
+        if t2.status.state == TaskState.completed:
+            updater.complete()
+            logger.debug(f"Task completed")
+        else:
+            self._update_fail(updater, "Owner agent failed: "+self._text(t2.status.message))
     
     # Helper functions
-    def _pay_contract(self, contract, content_id: str, value: int):
-        nonce = w3.eth.get_transaction_count(acct.address)
-        txn = contract.functions.makePayment(Web3.keccak(text=content_id)).build_transaction({
-            "from": acct.address,
-            "value": value,
-            "gas": 100000,
-            "gasPrice": w3.eth.gas_price,
-            "nonce": nonce,
-            "chainId": w3.eth.chain_id,
-        })
-        signed = acct.sign_transaction(txn)
-        return w3.eth.send_raw_transaction(signed.raw_transaction)
-    
+    def _forward(self, updater: TaskUpdater):
+        """Relays progress and artifacts of the owner agent's task to our own task"""
+        def on_update(event: UpdateEvent):
+            if isinstance(event, TaskArtifactUpdateEvent):
+                artifact = event.artifact
+                updater.add_artifact(artifact.parts, artifact.artifactId, artifact.name, artifact.metadata)
+            elif event.status.state == TaskState.working and self._text(event.status.message):
+                self._update_status(updater, self._text(event.status.message))
+        return on_update
+
+    def _text(self, message: Message | None) -> str:
+        return get_message_text(message) if message else ""
+
     def _update_status(self, updater: TaskUpdater, msg: str):
         updater.update_status(TaskState.working, message=self._msg(updater, msg))
 
@@ -155,4 +178,9 @@ class UserAgentExecutor(AgentExecutor):
         return updater.new_agent_message([Part(TextPart(text=txt))])
     
     async def cancel(self, context: RequestContext, event_queue: EventQueue):
-        raise ServerError(error=UnsupportedOperationError())
\ No newline at end of file
+        raise ServerError(error=UnsupportedOperationError())
+
+    async def aclose(self):
+        await self.payments.aclose()
+        await self.remotes.aclose()
+        await w3.provider.disconnect()
\ No newline at end of file
@@ -0,0 +1,236 @@
+import asyncio, click, json, logging, os, sys, time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+# common/ lives at the repository root, next to this agent's directory
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from a2a.server.request_handlers import DefaultRequestHandler
+from a2a.server.tasks import InMemoryTaskStore
+from a2a.types import (
+    Message, MessageSendParams, Part, TaskArtifactUpdateEvent, TaskState, TaskStatusUpdateEvent, TextPart,
+)
+from a2a.utils import get_message_text
+
+from common.remote import PEER_MODES
+
+from agent_executor import PAYMENT_MODES, UserAgentExecutor
+
+
+CONCURRENCY = 8
+# Status messages of UserAgentExecutor that start each timed phase
+PHASES = {
+    "Sending query...": "invoice",
+    "Paying contract...": "payment",
+    "Signing voucher...": "payment",
+    "Sending contentId...": "content",
+}
+
+logger = logging.getLogger(__name__)
+
+
+# ────────────────── batch runner ──────────────────
+class BatchRunner:
+    """
+    Runs UserAgentExecutor flows for a stream of queries, `concurrency` at a time
+
+    Each query is driven in-process through the same request handler the
+    server uses, so it is invoiced, paid for and fetched exactly as if it had
+    been sent to the UserAgent. One result record is produced per query.
+    """
+
+    def __init__(self, executor: UserAgentExecutor, remote_url: str, concurrency: int = CONCURRENCY):
+        self.remote_url = remote_url
+        self.concurrency = concurrency
+        self.task_store = InMemoryTaskStore()
+        self.handler = DefaultRequestHandler(agent_executor=executor, task_store=self.task_store)
+
+    async def run(self, jobs, write):
+        """Runs every job from the iterable `jobs` and passes each result record to `write`"""
+        queue: asyncio.Queue = asyncio.Queue(self.concurrency * 2)
+
+        async def worker():
+            while (job := await queue.get()) is not None:
+                write(await self.run_one(job))
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            for job in jobs:
+                await queue.put(job)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+
+    async def run_one(self, job: dict) -> dict:
+        """Runs a single query and returns its result record with per-phase timings"""
+        if "invalid" in job:
+            logger.error(f"Query {job['id']} is invalid: {job['invalid']}")
+            return {
+                "id": job["id"], "query": job.get("query"), "state": "invalid", "error": job["invalid"],
+                "task_id": None, "timings": {"total": 0.0},
+            }
+        started = time.monotonic()
+        record = {
+            "id": job["id"],
+            "query": job["query"],
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        phases, first_artifact, task_id, state, status_text = {}, None, None, None, None
+        message = Message(
+            role="user",
+            messageId=str(uuid4()),
+            parts=[
+                Part(TextPart(text=job["query"])),
+                Part(TextPart(text=job.get("remote_url") or self.remote_url)),
+            ],
+        )
+        try:
+            async for event in self.handler.on_message_send_stream(MessageSendParams(message=message)):
+                elapsed = time.monotonic() - started
+                if isinstance(event, TaskArtifactUpdateEvent):
+                    first_artifact = first_artifact or elapsed
+                elif isinstance(event, TaskStatusUpdateEvent):
+                    task_id, state = event.taskId, event.status.state
+                    status_text = get_message_text(event.status.message) if event.status.message else None
+                    if status_text in PHASES:
+                        phases.setdefault(PHASES[status_text], elapsed)
+        except Exception as e:
+            logger.error(f"Query {job['id']} failed: {e}")
+            record.update(state="error", error=str(e))
+        else:
+            task = await self.task_store.get(task_id) if task_id else None
+            record["state"] = state.value if state else "unknown"
+            if state == TaskState.completed and task:
+                record["result"] = "".join(
+                    part.root.text for artifact in task.artifacts or [] for part in artifact.parts
+                    if isinstance(part.root, TextPart)
+                )
+            else:
+                record["error"] = status_text or record["state"]
+        finally:
+            if task_id:
+                await self.task_store.delete(task_id)
+        record["task_id"] = task_id
+        record["timings"] = self._timings(phases, first_artifact, time.monotonic() - started)
+        return record
+
+    # Helper functions
+    def _timings(self, phases: dict, first_artifact: float | None, total: float) -> dict:
+        """Seconds spent in each phase reached, plus time to first artifact and in total"""
+        timings, marks = {}, sorted(phases.items(), key=lambda item: item[1])
+        for (phase, start), (_, end) in zip(marks, [*marks[1:], (None, total)]):
+            timings[phase] = round(end - start, 3)
+        if first_artifact is not None:
+            timings["first_artifact"] = round(first_artifact, 3)
+        timings["total"] = round(total, 3)
+        return timings
+
+
+# Helper functions
+def read_jobs(path: str, done: set[str]):
+    """
+    Yields the queries of a JSONL file not already in `done`; ids default to the line number.
+    A line that holds no query is yielded with the reason under "invalid", to be recorded as failed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                job = {"invalid": f"Not JSON: {e}"}
+            if isinstance(job, str):
+                job = {"query": job}
+            elif not isinstance(job, dict):
+                job = {"invalid": "Expected a query string or an object"}
+            job["id"] = str(job.get("id", number))
+            if "invalid" not in job:
+                if not isinstance(job.get("query"), str) or not job["query"].strip():
+                    job["invalid"] = 'Missing "query" text'
+                elif not isinstance(job.get("remote_url") or "", str):
+                    job["invalid"] = '"remote_url" must be a string'
+            if job["id"] not in done:
+                yield job
+
+
+def finished_ids(path: str, retry_failed: bool) -> set[str]:
+    """
+    Ids already recorded in an output JSONL file, so an interrupted run can pick up where it stopped.
+    The file is rewritten with one record per id, and without the records `retry_failed` will replace,
+    so that new results don't end up next to the ones they supersede.
+    """
+    if not os.path.exists(path):
+        return set()
+    records, rewrite = {}, False
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                rewrite = True
+                continue  # last line cut short by the interruption
+            rewrite = rewrite or record["id"] in records
+            records[record["id"]] = record
+    if retry_failed:
+        failed = [job_id for job_id, record in records.items() if record.get("state") != TaskState.completed.value]
+        for job_id in failed:
+            del records[job_id]
+        rewrite = rewrite or bool(failed)
+    if rewrite:
+        # Written aside first, so an interruption leaves either the old file or the new one
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+    return set(records)
+
+
+# ────────────────── batch CLI ──────────────────
+@click.command()
+@click.argument('queries', type=click.Path(exists=True, dir_okay=False))  # JSONL: {"id", "query"[, "remote_url"]} per line
+@click.argument('results', type=click.Path(dir_okay=False))               # JSONL, appended to and resumed from
+@click.option('--remote-url', 'remote_url', default='http://localhost:10001')  # billing agent, unless a line names one
+@click.option('--concurrency', default=CONCURRENCY)    # queries in flight at once
+@click.option('--retry-failed/--no-retry-failed', 'retry_failed', default=False)  # re-run queries that did not complete
+@click.option(                                # how to follow tasks on remote agents
+    '--peer-mode', 'peer_mode', type=click.Choice(PEER_MODES), default='stream'
+)
+@click.option('--max-connections', 'max_connections', default=20)  # per remote agent
+@click.option('--http2/--no-http2', default=False)  # requires the 'h2' package
+@click.option(                                # pay on-chain per request, or with vouchers against a deposit
+    '--payment-mode', 'payment_mode', type=click.Choice(PAYMENT_MODES), default='onchain'
+)
+def main(queries, results, remote_url, concurrency, retry_failed, peer_mode, max_connections, http2, payment_mode):
+    """Runs every query in QUERIES through the UserAgent flow and appends the results to RESULTS"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    done = finished_ids(results, retry_failed)
+    if done:
+        logger.info(f"Resuming: skipping {len(done)} queries already in {results}")
+    asyncio.run(run_batch(
+        read_jobs(queries, done), results, remote_url, concurrency,
+        UserAgentExecutor(peer_mode, payment_mode, max_connections=max_connections, http2=http2),
+    ))
+
+
+async def run_batch(jobs, results: str, remote_url: str, concurrency: int, executor: UserAgentExecutor):
+    counts = {}
+    with open(results, "a", encoding="utf-8") as out:
+        # Every record is flushed as soon as it is written, so an interruption loses only queries in flight
+        def write(record: dict):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[record["state"]] = counts.get(record["state"], 0) + 1
+            logger.info(f"[{record['id']}] {record['state']} in {record['timings']['total']:.2f}s")
+        try:
+            await BatchRunner(executor, remote_url, concurrency).run(jobs, write)
+        finally:
+            await executor.aclose()
+    logger.info(f"Batch finished: {counts}")
+
+
+if __name__ == '__main__':
+    main()
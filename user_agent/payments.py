@@ -0,0 +1,247 @@
+import asyncio, itertools, logging, time
+from typing import Callable
+from eth_account import Account
+from hexbytes import HexBytes
+from opentelemetry import trace
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TransactionNotFound
+
+from common.vouchers import sign_voucher
+
+
+GAS_LIMIT = 100000
+GAS_PRICE_TTL = 15    # seconds a fetched gas price is reused
+POLL_INTERVAL = 1     # seconds between checks for new blocks
+RECEIPT_TIMEOUT = 120
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+class PaymentPending(Exception):
+    """The payment was sent but its receipt did not arrive in time; it may still be mined"""
+
+    def __init__(self, tx_hash: str, timeout: float):
+        super().__init__(f"Payment transaction {tx_hash} still pending after {timeout:g}s")
+        self.tx_hash = tx_hash
+
+
+# ────────────────── wallet lane ──────────────────
+class WalletLane:
+    """
+    One hot wallet and the next nonce it will use
+
+    The nonce is read from the node once and then allocated locally, so
+    payments from the same wallet never race for the same nonce.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self.nonce: int | None = None
+        self.in_flight = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def address(self) -> str:
+        return self.account.address
+
+
+# ────────────────── receipt watcher ──────────────────
+class ReceiptWatcher:
+    """
+    Waits for the receipts of many transactions with a single polling loop
+
+    The loop only runs while transactions are pending. Each new block is
+    fetched once and the receipts of pending transactions it contains are
+    handed to their waiters, however many payments are in flight.
+    """
+
+    def __init__(self, w3: AsyncWeb3, poll_interval: float = POLL_INTERVAL):
+        self.w3 = w3
+        self.poll_interval = poll_interval
+        self.last_block: int | None = None
+        self._pending: dict[HexBytes, asyncio.Future] = {}
+        self._unchecked: set[HexBytes] = set()  # registered since the last poll
+        self._task: asyncio.Task | None = None
+
+    def watch(self, txh) -> asyncio.Future:
+        """Registers a transaction hash, ideally before it is sent, and returns the future of its receipt"""
+        txh = HexBytes(txh)
+        if txh not in self._pending:
+            self._pending[txh] = asyncio.get_running_loop().create_future()
+            self._unchecked.add(txh)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._pending[txh]
+
+    async def wait(self, txh, timeout: float = RECEIPT_TIMEOUT):
+        txh = HexBytes(txh)
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.watch(txh)), timeout)
+        finally:
+            self.discard(txh)
+
+    def discard(self, txh):
+        txh = HexBytes(txh)
+        future = self._pending.pop(txh, None)
+        self._unchecked.discard(txh)
+        if future and not future.done():
+            future.cancel()
+
+    async def aclose(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # Helper functions
+    async def _run(self):
+        while self._pending:
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.warning(f"Receipt watcher poll failed: {e}")
+            if self._pending:
+                await asyncio.sleep(self.poll_interval)
+        self.last_block = None
+
+    async def _poll(self):
+        latest = await self.w3.eth.block_number
+        # Transactions registered since the last poll may already be mined in a block we've scanned
+        unchecked, self._unchecked = self._unchecked, set()
+        found = {txh for txh in unchecked if txh in self._pending}
+        if self.last_block is not None:
+            for number in range(self.last_block + 1, latest + 1):
+                block = await self.w3.eth.get_block(number)
+                found.update(HexBytes(txh) for txh in block["transactions"] if HexBytes(txh) in self._pending)
+        self.last_block = latest
+        receipts = await asyncio.gather(
+            *(self._receipt(txh) for txh in found), return_exceptions=True
+        )
+        for txh, receipt in zip(found, receipts):
+            if isinstance(receipt, Exception):
+                # Try this one again directly on the next poll
+                logger.warning(f"Fetching receipt {txh.hex()} failed: {receipt}")
+                self._unchecked.add(txh)
+                continue
+            future = self._pending.get(txh)
+            if receipt is not None and future is not None:
+                if not future.done():
+                    future.set_result(receipt)
+                del self._pending[txh]
+
+    async def _receipt(self, txh: HexBytes):
+        try:
+            return await self.w3.eth.get_transaction_receipt(txh)
+        except TransactionNotFound:
+            return None
+
+
+# ────────────────── payment engine ──────────────────
+class PaymentEngine:
+    """
+    Pays invoices from a pool of hot wallets
+
+    Each payment goes to the wallet with the fewest payments in flight. Only
+    signing and sending hold a wallet's lock; receipts are awaited outside it,
+    so every wallet can have several transactions pending at once, and one
+    ReceiptWatcher serves all of them. The chain id is fetched once and the
+    gas price is cached for GAS_PRICE_TTL seconds.
+    """
+
+    def __init__(
+        self, w3: AsyncWeb3, private_keys: list[str], gas_limit: int = GAS_LIMIT, voucher_key: str | None = None,
+        receipt_timeout: float = RECEIPT_TIMEOUT,
+    ):
+        if not private_keys:
+            raise ValueError("At least one wallet private key is required")
+        self.w3 = w3
+        self.gas_limit = gas_limit
+        self.receipt_timeout = receipt_timeout
+        self.lanes = [WalletLane(Account.from_key(key)) for key in private_keys]
+        # The wallet holding the prepaid deposit, the first lane unless given
+        self.voucher_account = Account.from_key(voucher_key) if voucher_key else self.lanes[0].account
+        self.receipts = ReceiptWatcher(w3)
+        self._order = itertools.cycle(range(len(self.lanes)))
+        self._chain_id: int | None = None
+        self._gas_price: tuple[int, float] | None = None  # (price, time fetched)
+
+    async def pay(self, contract, content_id: str, value: int, on_sent: Callable[[], None] | None = None) -> str:
+        """
+        Pays `value` for `content_id` and returns the paying address once the receipt is in.
+        `on_sent` is called once the transaction has been accepted by the node. Raises
+        PaymentPending if the receipt does not arrive within `receipt_timeout` seconds.
+        """
+        lane = self._pick_lane()
+        lane.in_flight += 1
+        try:
+            with tracer.start_as_current_span("payment.build_sign_send", attributes={"wallet": lane.address}):
+                txh = await self._send(lane, contract, content_id, value)
+            if on_sent:
+                on_sent()
+            with tracer.start_as_current_span("payment.receipt_wait", attributes={"tx_hash": txh.hex()}):
+                try:
+                    receipt = await self.receipts.wait(txh, self.receipt_timeout)
+                except asyncio.TimeoutError:
+                    raise PaymentPending(txh.to_0x_hex(), self.receipt_timeout)
+            if receipt["status"] != 1:
+                raise RuntimeError(f"Payment transaction {txh.hex()} reverted")
+            return lane.address
+        finally:
+            lane.in_flight -= 1
+
+    def voucher(self, chain_id: int, contract_address: str, content_id: str, value: int) -> tuple[str, str]:
+        """Signs a prepaid voucher with the wallet holding the deposit; returns (payer, signature)"""
+        account = self.voucher_account
+        return account.address, sign_voucher(account, chain_id, contract_address, content_id, value)
+
+    def stats(self) -> dict:
+        return {lane.address: {"nonce": lane.nonce, "in_flight": lane.in_flight} for lane in self.lanes}
+
+    async def aclose(self):
+        await self.receipts.aclose()
+
+    # Helper functions
+    def _pick_lane(self) -> WalletLane:
+        # Least loaded wallet; ties go round-robin so idle wallets share the work
+        start = next(self._order)
+        rotated = self.lanes[start:] + self.lanes[:start]
+        return min(rotated, key=lambda lane: lane.in_flight)
+
+    async def _send(self, lane: WalletLane, contract, content_id: str, value: int):
+        chain_id = await self._get_chain_id()
+        gas_price = await self._get_gas_price()
+        async with lane.lock:
+            if lane.nonce is None:
+                lane.nonce = await self.w3.eth.get_transaction_count(lane.address, "pending")
+            txn = await contract.functions.makePayment(Web3.keccak(text=content_id)).build_transaction({
+                "from": lane.address,
+                "value": value,
+                "gas": self.gas_limit,
+                "gasPrice": gas_price,
+                "nonce": lane.nonce,
+                "chainId": chain_id,
+            })
+            signed = lane.account.sign_transaction(txn)
+            # Watch before sending so a fast confirmation can't slip past the watcher
+            self.receipts.watch(signed.hash)
+            try:
+                txh = await self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            except Exception:
+                # The node's view of the nonce is the truth again after a rejected send
+                self.receipts.discard(signed.hash)
+                lane.nonce = None
+                raise
+            lane.nonce += 1
+        logger.debug(f"Sent payment {txh.hex()} from {lane.address} (nonce {txn['nonce']})")
+        return txh
+
+    async def _get_chain_id(self) -> int:
+        if self._chain_id is None:
+            self._chain_id = await self.w3.eth.chain_id
+        return self._chain_id
+
+    async def _get_gas_price(self) -> int:
+        now = time.monotonic()
+        if self._gas_price is None or now - self._gas_price[1] > GAS_PRICE_TTL:
+            self._gas_price = (await self.w3.eth.gas_price, now)
+        return self._gas_price[0]
@@ -0,0 +1,72 @@
+import click, json, os
+from dotenv import load_dotenv
+from eth_account import Account
+from web3 import Web3
+
+
+# ────────────────── deposit CLI ──────────────────
+@click.group()
+@click.option('--rpc-url', 'rpc_url', default=None)         # defaults to RPC_URL or the WorldLand endpoint
+@click.option('--contract', 'contract_address', default=None)  # defaults to CONTRACT_ADDRESS
+@click.pass_context
+def main(ctx, rpc_url, contract_address):
+    """Manages the prepaid deposit that voucher payments draw from"""
+    load_dotenv()
+    w3 = Web3(Web3.HTTPProvider(rpc_url or os.getenv("RPC_URL", "https://seoul.worldland.foundation/")))
+    with open("billing_agent/contract_abi.json", "r") as f:
+        abi = json.load(f)
+    keys = os.getenv("PRIVATE_KEYS_USER") or os.getenv("PRIVATE_KEY_USER") or ""
+    ctx.obj = {
+        "w3": w3,
+        "contract": w3.eth.contract(address=contract_address or os.getenv("CONTRACT_ADDRESS"), abi=abi),
+        # Vouchers are always signed by the first configured wallet
+        "account": Account.from_key(keys.split(",")[0].strip()),
+    }
+
+
+@main.command()
+@click.pass_obj
+def balance(obj):
+    contract, address = obj["contract"], obj["account"].address
+    deposit = contract.functions.deposits(address).call()
+    withdraw_after = contract.functions.withdrawAfter(address).call()
+    click.echo(f"{address}: {Web3.from_wei(deposit, 'ether')} WLC deposited")
+    if withdraw_after:
+        click.echo(f"Withdrawal available after {withdraw_after} (unix time)")
+
+
+@main.command()
+@click.argument('amount', type=float)
+@click.pass_obj
+def deposit(obj, amount):
+    """Deposits AMOUNT WLC"""
+    _transact(obj, obj["contract"].functions.deposit(), Web3.to_wei(amount, 'ether'))
+
+
+@main.command('request-withdrawal')
+@click.pass_obj
+def request_withdrawal(obj):
+    _transact(obj, obj["contract"].functions.requestWithdrawal())
+
+
+@main.command()
+@click.pass_obj
+def withdraw(obj):
+    _transact(obj, obj["contract"].functions.withdrawDeposit())
+
+
+def _transact(obj, function, value: int = 0):
+    w3, account = obj["w3"], obj["account"]
+    txn = function.build_transaction({
+        "from": account.address,
+        "value": value,
+        "nonce": w3.eth.get_transaction_count(account.address, "pending"),
+        "chainId": w3.eth.chain_id,
+    })
+    txh = w3.eth.send_raw_transaction(account.sign_transaction(txn).raw_transaction)
+    receipt = w3.eth.wait_for_transaction_receipt(txh)
+    click.echo(f"{'Confirmed' if receipt['status'] == 1 else 'Reverted'}: {txh.hex()}")
+
+
+if __name__ == '__main__':
+    main()